@@ -19,6 +19,7 @@ Rob Gaddi, Highland Technology, Inc.
 
 from __future__ import print_function
 from ctypes import *
+from operator import index
         
 #######################################################################
 # Define our class member functions out here, they need to be manually
@@ -34,12 +35,11 @@ class Bitfield(object):
         
     def __iter__(self):
         """Return an iterator over the field names."""
-        subfields = (t[0] for t in self._b._fields_)
-        return (f for f in subfields if not f.startswith('_'))
+        return iter(self._fieldnames_)
 
     def keys(self):
         """Return a list of the field names."""
-        return list(iter(self))
+        return list(self._fieldnames_)
 
     def clone(self):
         """Return a new bitfield with the same value.
@@ -51,19 +51,25 @@ class Bitfield(object):
         against that clone, means that only one read will occur.
         
         """
-        temp = self.__class__()
-        temp.base = self.base
-        return temp
+        return self.__class__.from_buffer_copy(self)
         
     def items(self):
         """
         Returns an iterator over the named bitfields in the structure as
-        2-tuples of (key, value).  Uses a clone so as to only read from
-        the underlying data once.
+        2-tuples of (key, value).  The underlying data is only read once,
+        and the fields are all sliced out of that single value.
         
         """
-        temp = self.clone()
-        return [(f, getattr(temp, f)) for f in iter(self)]
+        raw = self._raw
+        layout = self._fieldlayout_
+        results = []
+        for f in self._fieldnames_:
+            shift, mask, signed = layout[f]
+            v = (raw >> shift) & mask
+            if signed and v > (mask >> 1):
+                v -= mask + 1
+            results.append((f, v))
+        return results
         
     def update(self, E=None, **F):
         '''
@@ -77,21 +83,36 @@ class Bitfield(object):
         in case the target is a memory-mapped register.  The read and write
         are independent, rather than an atomic RMW cycle.
         
+        Any field can be named, including the hidden ones whose names start
+        with an underscore, just as with setting the fields one at a time.
+        So can base, which is written first with the other fields going
+        on top of it.  Names that aren't fields at all are ignored.
+        
         '''
         
-        temp = self.clone()
+        updates = []
         if E:
             try:
-                for k in E.keys():
-                    setattr(temp, k, E[k])
+                updates.extend((k, E[k]) for k in E.keys())
             except (AttributeError, ValueError):
-                for k, v in E:
-                    setattr(temp, k, v)
-                    
-        for k, v in F.items():
-            setattr(temp, k, v)
-            
-        self.base = temp.base
+                updates.extend(E)
+        updates.extend(F.items())
+        
+        base = [v for k, v in updates if k == 'base']
+        if base:
+            self.base = base[-1]
+        
+        # Rather than setting the fields one at a time, do all the masking
+        # on the raw integer and then write it back in one go.
+        layout = self._fieldlayout_
+        raw = self._raw
+        for k, v in updates:
+            try:
+                shift, mask, signed = layout[k]
+            except KeyError:
+                continue
+            raw = (raw & ~(mask << shift)) | ((index(v) & mask) << shift)
+        self._raw = raw
         
     def __repr__(self):
         """Provide a good looking view for interactive use."""
@@ -113,6 +134,107 @@ Subfields are:
 
 _docstring_field_template = '    {name:{nw}} - {n} bit {base} \n'
 
+#######################################################################
+# Template bits for per-class items and update methods.
+#######################################################################
+
+# make_bf knows exactly where every field lives, so rather than having
+# items() and update() loop over _fieldlayout_ on every call, it writes
+# out straight-line versions of them for each class with all the shifts
+# and masks filled in.  The general versions in Bitfield remain as the
+# reference implementation.
+
+_items_template = """
+def items(self):
+    raw = self._raw
+    return [{fields}]
+"""
+
+_items_field_template = "({name!r}, (raw >> {shift}) & {mask:#x})"
+_items_signed_template = "({name!r}, (((raw >> {shift}) & {mask:#x}) ^ {sign:#x}) - {sign:#x})"
+
+_update_template = """
+def update(self, E=None, **F):
+    changes = dict(E, **F) if E else F
+    if 'base' in changes:
+        self.base = changes['base']
+    raw = self._raw
+{fields}
+    self._raw = raw
+"""
+
+_update_field_template = """    if {name!r} in changes:
+        raw = (raw & {keep:#x}) | ((index(changes[{name!r}]) & {mask:#x}) << {shift})
+"""
+
+def _compile_methods(fieldnames, fieldlayout, rawbits):
+    """Return a dict of the items and update methods for a Bitfield class
+    with the given public fieldnames and _fieldlayout_, where the whole
+    register is rawbits wide.
+    """
+    
+    itemfields = []
+    for name in fieldnames:
+        shift, mask, signed = fieldlayout[name]
+        template = _items_signed_template if signed else _items_field_template
+        itemfields.append(template.format(
+            name = name, shift = shift, mask = mask, sign = (mask + 1) >> 1
+        ))
+        
+    rawmask = (1 << rawbits) - 1
+    updatefields = []
+    for name, (shift, mask, signed) in sorted(fieldlayout.items()):
+        updatefields.append(_update_field_template.format(
+            name = name, shift = shift, mask = mask,
+            keep = rawmask & ~(mask << shift)
+        ))
+        
+    source = (
+        _items_template.format(fields = ', '.join(itemfields)) +
+        _update_template.format(fields = ''.join(updatefields))
+    )
+    namespace = {'index' : index, '__name__' : __name__}
+    exec(source, namespace)
+    
+    methods = {}
+    for m in ('items', 'update'):
+        methods[m] = namespace[m]
+        methods[m].__doc__ = getattr(Bitfield, m).__doc__
+    return methods
+
+#######################################################################
+# Resizing field types to match the basetype.
+#######################################################################
+
+_unsigned_types = (c_uint8, c_uint16, c_uint32, c_uint64)
+_signed_types = (c_int8, c_int16, c_int32, c_int64)
+
+# Maps the size of a basetype to a dict of {allowed field type : the type
+# that fields of that type are resized to}.  Filled in as needed.
+_fixed_types = {}
+
+def _fixed_types_for(basesize):
+    """Return the field type resizing dict for a basetype of basesize bytes."""
+    try:
+        return _fixed_types[basesize]
+    except KeyError:
+        pass
+        
+    unsigned    = next(t for t in _unsigned_types if sizeof(t) >= basesize)
+    signed      = next(t for t in _signed_types if sizeof(t) >= basesize)
+    
+    fixed = dict.fromkeys(_unsigned_types + (c_bool,), unsigned)
+    fixed.update(dict.fromkeys(_signed_types, signed))
+    _fixed_types[basesize] = fixed
+    return fixed
+
+#######################################################################
+# Finished Bitfield classes, keyed by the arguments to make_bf that built
+# them, so that the same definition doesn't get built twice.
+#######################################################################
+
+_bitfield_classes = {}
+
 #######################################################################
 # Exported functions.
 #######################################################################
@@ -146,29 +268,52 @@ def make_bf(name, fields, basetype=c_uint32, doc=None):
             
         doc
             The optional docstring for the newly created class.
+            
+    Calling make_bf again with the same arguments returns the same class
+    rather than building a new one.
     
     """
+    fields = list(fields)
+    try:
+        key = (name, tuple(tuple(f) for f in fields), basetype, doc)
+        return _bitfield_classes[key]
+    except KeyError:
+        pass
+    except TypeError:
+        # Something unhashable in there, so it can't be looked up.
+        key = None
+        
     # We need to hack on the fields array to get our integer sizes correct.
-    unsigned_types = [c_uint8, c_uint16, c_uint32, c_uint64]
-    signed_types = [c_int8, c_int16, c_int32, c_int64]
-    
-    unsigned    = next(t for t in unsigned_types if sizeof(t) >= sizeof(basetype))
-    signed      = next(t for t in signed_types if sizeof(t) >= sizeof(basetype))
+    fixed_types = _fixed_types_for(sizeof(basetype))
+    unsigned    = fixed_types[c_uint8]
+    signed      = fixed_types[c_int8]
     
     def fixed_type(t):
-        if t in unsigned_types:
-            return unsigned
-        elif t in signed_types:
-            return signed
-        elif t is c_bool:
-            return unsigned
-        else:
-            try:
-                raise TypeError("Field of type {0} not allowed, only integer and boolean types.".format(t.__name__))
-            except AttributeError:
-                raise TypeError("{0!r} not a class.".format(t))
+        try:
+            return fixed_types[t]
+        except (KeyError, TypeError):
+            pass
+        try:
+            raise TypeError("Field of type {0} not allowed, only integer and boolean types.".format(t.__name__))
+        except AttributeError:
+            raise TypeError("{0!r} not a class.".format(t))
     
     fields = [ (name, fixed_type(cls), size) for (name, cls, size) in fields ]
+    
+    # Record the size and offset of each public field in (fractional)
+    # bytes, which is the form bitfield.walk needs them in.  ctypes mangles
+    # this information, so it's easiest to work out while we have it.
+    #
+    # At the same time, work out the (shift, mask, signed) layout of every
+    # field within the raw integer so update() can do its own bit twiddling.
+    fieldlist = []
+    fieldlayout = {}
+    offset = 0
+    for fname, cls, size in fields:
+        if fname[:1] != '_':
+            fieldlist.append( (fname, cls, size/8.0, offset/8.0) )
+        fieldlayout[fname] = (offset, (1 << size) - 1, cls is signed)
+        offset += size
 
     # Define the underlying bitfield type
     bitfield = type(name + '_bitfield', (LittleEndianStructure, ), {})
@@ -191,12 +336,24 @@ def make_bf(name, fields, basetype=c_uint32, doc=None):
             ) for t in fields
         )
 
-    # Set up the union
+    # Set up the union.  _raw gives us the whole register as an unsigned
+    # integer in the same bit order as the bitfield, whatever the basetype.
     d = {
-        '_fields_' : [('base', basetype), ('_b', bitfield)],
+        '_fields_' : [
+            ('base', basetype),
+            ('_b', bitfield),
+            ('_raw', unsigned.__ctype_le__)
+        ],
+        '_fieldlist_' : tuple(fieldlist),
+        '_fieldlayout_' : fieldlayout,
+        '_fieldnames_' : tuple(t[0] for t in fieldlist),
         '__doc__' : doc
     }
-    return type(name, (Union, Bitfield), d)
+    d.update(_compile_methods(d['_fieldnames_'], fieldlayout, 8 * sizeof(unsigned)))
+    cls = type(name, (Union, Bitfield), d)
+    if key is not None:
+        _bitfield_classes[key] = cls
+    return cls
 
 def print_fields(bf, *args, **kwargs):
     """
@@ -37,6 +37,15 @@ This also allows for functional programming::
         leafsize = sum(n.size for n in bitfield.walk.walk(st) if not len(n))
         return ctypes.sizeof(st) == leafsize
 
+If the same class is going to be asked about repeatedly, compile_tree flattens
+the whole walk into a CompiledTree of parallel tuples, one entry per node, and
+keeps it so later calls don't have to create any Nodes at all::
+
+    def tightlypacked(st):
+        ct = bitfield.walk.compile_tree(st)
+        leafsize = sum(s for s, leaf in zip(ct.sizes, ct.leaf_mask) if leaf)
+        return ctypes.sizeof(st) == leafsize
+
 Bitfield Notes
 --------------
 Given the integration of this package with the bitfield package, the implications
@@ -74,16 +83,21 @@ from __future__ import print_function
 
 import ctypes
 import re
-from collections import Sequence
+try:
+    # Python 3.3 and later
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Sequence
+from collections import namedtuple
 from inspect import isclass
-from functools import partial
 
 from . import Bitfield, make_bf
 
 __all__ = [
     'Node', 'BoundNode', 'UnboundNode',
     'display', 'findnode', 'offsetof',
-    'walknode', 'walk'
+    'walknode', 'walk',
+    'CompiledTree', 'compile_tree'
 ]
 
 bf_pyramid = make_bf('bf_pyramid', [
@@ -142,46 +156,65 @@ class Node(Sequence):
     
     """
     
-    def __init__(self, parent=None, name='', offset=0, **kwargs):
-        self.name = name
+    # There can be an awful lot of nodes in a walk, so none of them get an
+    # instance __dict__.
+    __slots__ = ('parent', '_depth', '_baseoffset')
+    
+    def __init__(self, parent=None):
         self.parent = parent
-        self.offset = offset
-        self.__dict__.update(kwargs)
+        
+        # depth and baseoffset get asked for over and over again for the same
+        # node (display uses both on every row), so they're cached the first
+        # time.  Since a node's cached value is built from its parent's, the
+        # whole chain up to the root only ever gets worked out once.
+        self._depth = None
+        self._baseoffset = None
 
     @property
     def parents(self):
         """A list of all the parent nodes of this node, back to the root.
         parents[0] is the root, and parents[-1] is the immediate parent.
         """
-        try:
-            parents = self.parent.parents
-            parents.append(self.parent)
-        except AttributeError:
-            parents = []
+        parents = []
+        node = self.parent
+        while node is not None:
+            parents.append(node)
+            node = node.parent
+        parents.reverse()
         return parents
         
     def _getchild(self, idx):
         raise NotImplementedError
     
+    def __iter__(self):
+        """Iterate over the child nodes.
+        
+        Sequence would do this by indexing until it hits an IndexError, but
+        we always know our length up front.
+        """
+        for idx in range(len(self)):
+            yield self[idx]
+    
     def pathparts(self):
         """A list of the parts of the path, with the root node returning
         an empty list.
         """
-        try:
-            parts = self.parent.pathparts()
-            parts.append(self.name)
-            return parts
-        except AttributeError:
-            return []
+        parts = []
+        node = self
+        while node.parent is not None:
+            parts.append(node.name)
+            node = node.parent
+        parts.reverse()
+        return parts
     
     @property
     def root(self):
         """The root node for this node.  If this node is the root node, returns
         itself, otherwise equivalent to parents[0]."""
-        try:
-            return self.parent.root
-        except AttributeError:
-            return self
+        node = self
+        while node.parent is not None:
+            node = node.parent
+        return node
             
     @property
     def path(self):
@@ -191,10 +224,12 @@ class Node(Sequence):
     @property
     def baseoffset(self):
         """The offset of this node from the root node."""
-        try:
-            return self.parent.baseoffset + self.offset
-        except AttributeError:
-            return self.offset
+        if self._baseoffset is None:
+            if self.parent is None:
+                self._baseoffset = self.offset
+            else:
+                self._baseoffset = self.parent.baseoffset + self.offset
+        return self._baseoffset
         
     @property
     def depth(self):
@@ -203,18 +238,17 @@ class Node(Sequence):
         The root has a depth of 0, each child of the root a depth of 1, etc.
         This is equivalent to, but slightly more efficient than, len(self.parents)
         """
-        try:
-            return self.parent.depth + 1
-        except AttributeError:
-            return 0
+        if self._depth is None:
+            if self.parent is None:
+                self._depth = 0
+            else:
+                self._depth = self.parent.depth + 1
+        return self._depth
             
     @property
     def size(self):
         """The size, in bytes, of the element pointed to."""
-        try:
-            return self._realsize
-        except AttributeError:
-            return ctypes.sizeof(self.type)
+        return ctypes.sizeof(self.type)
             
     def __repr__(self):
         return "{0} {1} ({2} @ offset {3})".format(
@@ -236,18 +270,37 @@ class Node(Sequence):
 #   offset      The offset of this node from its parent.
 #   _getindex   The argument to give the a bound parent object to get this one,
 #               such as 'bob' or int(2).
+#   _realsize   Optionally, the size of this node if it isn't sizeof(type),
+#               as is the case for Bitfield fields.
+
+# The shape of a ctypes class never changes, so anything we have to work out
+# about a class is worked out once and kept here rather than being redone
+# every time a node for that class is created.
+#
+#   _nodetypes      Maps a class to the UnboundNode subclass that handles it.
+#   _fieldlists     Maps a Bitfield class to its UnboundBitfieldNode field list.
+#   _structfields   Maps a Structure class to its UnboundStructureNode field
+#                   list and name lookup.
+
+_nodetypes = {}
+_fieldlists = {}
+_structfields = {}
 
 def _createunbound(kls, **info):
     """Create a new UnboundNode representing a given class."""
     
-    if issubclass(kls, Bitfield):
-        nodetype = UnboundBitfieldNode
-    elif hasattr(kls, '_fields_'):
-        nodetype = UnboundStructureNode
-    elif issubclass(kls, ctypes.Array):
-        nodetype = UnboundArrayNode
-    else:
-        nodetype = UnboundSimpleNode        
+    try:
+        nodetype = _nodetypes[kls]
+    except KeyError:
+        if issubclass(kls, Bitfield):
+            nodetype = UnboundBitfieldNode
+        elif hasattr(kls, '_fields_'):
+            nodetype = UnboundStructureNode
+        elif issubclass(kls, ctypes.Array):
+            nodetype = UnboundArrayNode
+        else:
+            nodetype = UnboundSimpleNode
+        _nodetypes[kls] = nodetype
     return nodetype(type=kls, **info)
         
 class UnboundNode(Node):
@@ -255,6 +308,24 @@ class UnboundNode(Node):
     
     There is a type element for each node, but no value."""
     
+    __slots__ = ('name', 'type', 'offset', '_getindex', '_realsize')
+    
+    def __init__(self, type, parent=None, name='', offset=0,
+                 _getindex=None, _realsize=None):
+        super(UnboundNode, self).__init__(parent)
+        self.name = name
+        self.type = type
+        self.offset = offset
+        self._getindex = _getindex
+        self._realsize = _realsize
+    
+    @property
+    def size(self):
+        """The size, in bytes, of the element pointed to."""
+        if self._realsize is None:
+            return ctypes.sizeof(self.type)
+        return self._realsize
+    
     def _childfromdict(self, d):
         kls = d.pop('type')
         child = _createunbound(kls, **d)
@@ -267,35 +338,55 @@ class UnboundNode(Node):
         return self._childfromdict(childinfo)
         
 class UnboundSimpleNode(UnboundNode):
+    __slots__ = ()
+    
     def __len__(self):
         return 0
     def _getchild(self, idx):
         raise IndexError('Simple data has no children.')
         
 class UnboundStructureNode(UnboundNode):
+    __slots__ = ()
+    
     def __len__(self):
         return len(self.type._fields_)
     
+    @staticmethod
+    def _fields_for(kls):
+        """Return (fieldlist, fieldmap) for the Structure class kls.
+        
+        fieldlist is a tuple of (name, type, offset) for each field, and
+        fieldmap maps each field name to its index in fieldlist.
+        """
+        try:
+            return _structfields[kls]
+        except KeyError:
+            pass
+            
+        fl = tuple(
+            (f[0], f[1], getattr(kls, f[0]).offset) for f in kls._fields_
+        )
+        fm = dict((f[0], n) for n, f in enumerate(fl))
+        info = _structfields[kls] = (fl, fm)
+        return info
+    
     def _getchild(self, idx):
+        fieldlist, fieldmap = self._fields_for(self.type)
         if isinstance(idx, str):
             # Look this up.
-            for fieldname, fieldtype, *_ in self.type._fields_:
-                if fieldname == idx:
-                    break
-            else:
-                raise KeyError(idx)
-        else:
-            # Must be an integer then
-            fieldname, fieldtype, *_ = self.type._fields_[idx]
+            idx = fieldmap[idx]
+        fieldname, fieldtype, offset = fieldlist[idx]
             
         return dict(
             name = '.' + fieldname,
             type = fieldtype,
-            offset = getattr(self.type, fieldname).offset,
+            offset = offset,
             _getindex = fieldname,
         )
         
 class UnboundArrayNode(UnboundNode):
+    __slots__ = ()
+    
     def __len__(self):
         return self.type._length_
         
@@ -314,17 +405,39 @@ class UnboundArrayNode(UnboundNode):
         )
         
 class UnboundBitfieldNode(UnboundNode):
+    __slots__ = ('_fieldlist',)
+    
     def __init__(self, *args, **kwargs):
         super(UnboundBitfieldNode, self).__init__(*args, **kwargs)
+        self._fieldlist = self._fieldlist_for(self.type)
         
+    @staticmethod
+    def _fieldlist_for(kls):
+        """Return a tuple of (name, type, size, offset) for each public field
+        of the Bitfield class kls.
+        
+        Classes built by make_bf carry this precomputed as _fieldlist_.  For
+        anything else it's worked out on the first request and kept.
+        """
+        try:
+            return kls._fieldlist_
+        except AttributeError:
+            pass
+        try:
+            return _fieldlists[kls]
+        except KeyError:
+            pass
+            
         # For bitfields we need to be extra clever figuring out the sizes
         # and offsets, since ctypes mangles that information.
         offset = 0
-        fl = self._fieldlist = []
-        for name, type, bits in self.type._fields_[1][1]._fields_:
-            if not name.startswith('_'):
+        fl = []
+        for name, type, bits in kls._fields_[1][1]._fields_:
+            if name[:1] != '_':
                 fl.append( (name, type, bits/8.0, offset/8.0) )
             offset += bits
+        fl = _fieldlists[kls] = tuple(fl)
+        return fl
         
     def __len__(self):
         return len(self._fieldlist)
@@ -358,24 +471,22 @@ class UnboundBitfieldNode(UnboundNode):
 #   valueget => _valueget   A function of no argument that returns our object
 #   valueset => _valueset   An optional function of one arguement that sets our object
        
+def _referenceclass(obj):
+    """Return the class to use as the UnboundNode reference for obj."""
+    # Start by allowing objects to define custom unbound reference hooks.
+    # Most objects won't have one, so look on the class without raising
+    # an AttributeError (or tripping a RemoteStruct's __getattr__).
+    hook = getattr(type(obj), '_unboundreference_', None)
+    if hook is None:
+        return type(obj)
+    return hook(obj)
+
 def _createbound(obj):
     """Create a new BoundNode representing a given object."""
-    # Start by allowing objects to define custom unbound reference hooks
-    try:
-        kls = obj._unboundreference_()
-    except AttributeError:
-        kls = type(obj)
-    
-    unbound = _createunbound(kls)
+    unbound = _createunbound(_referenceclass(obj))
     def valueget():
         return obj
-    for t in (BoundBitfieldNode, BoundStructureNode, BoundArrayNode):
-        if isinstance(unbound, t._unboundtype):
-            kls = t
-            break
-    else:
-        kls = BoundSimpleNode
-    
+    kls = _boundtypes.get(type(unbound), BoundSimpleNode)
     child = kls(unbound, valueget)
     return child
         
@@ -386,27 +497,24 @@ class BoundNode(Node):
     of the underlying structure, but also has a value property that ties
     it to a value in the instance."""
     
+    __slots__ = ('_unbound', '_valueget', '_valueset')
+    
     def __init__(self, unbound, valueget, valueset=None):
+        super(BoundNode, self).__init__()
         self._unbound = unbound
         self._valueget = valueget
         self._valueset = valueset
     
-    def _childgetter():
+    def _childaccessors(self, obj, idx):
+        """Return a (valueget, valueset) pair of functions for the child of
+        obj (our value) at idx."""
         raise NotImplementedError
     
     def _childfromdict(self, d):
         kls = d.pop('type')
         unbound = _createunbound(kls, **d)
-        valueget = partial(self._childgetter(), d['_getindex'])
-        valueset = partial(self._childsetter(), d['_getindex'])
-        
-        for t in (BoundBitfieldNode, BoundStructureNode, BoundArrayNode):
-            if isinstance(unbound, t._unboundtype):
-                kls = t
-                break
-        else:
-            kls = BoundSimpleNode
-        
+        valueget, valueset = self._childaccessors(self.value, d['_getindex'])
+        kls = _boundtypes.get(type(unbound), BoundSimpleNode)
         child = kls(unbound, valueget, valueset)
         child.parent = self
         return child
@@ -440,32 +548,49 @@ class BoundNode(Node):
     def name(self):
         return self._unbound.name
     
+    @property
+    def size(self):
+        return self._unbound.size
+    
 class BoundSimpleNode(BoundNode):
+    __slots__ = ()
     _unboundtype = UnboundSimpleNode
     
-    def _childgetter(self):
-        raise AttributeError
-    def _childsetter(self):
+    def _childaccessors(self, obj, idx):
         raise AttributeError
     
 class BoundStructureNode(BoundNode):
+    __slots__ = ()
     _unboundtype = UnboundStructureNode
     
-    def _childgetter(self):
-        return partial(getattr, self.value)
-    def _childsetter(self):
-        return partial(setattr, self.value)
+    def _childaccessors(self, obj, idx):
+        def valueget():
+            return getattr(obj, idx)
+        def valueset(val):
+            setattr(obj, idx, val)
+        return valueget, valueset
         
 class BoundArrayNode(BoundNode):
+    __slots__ = ()
     _unboundtype = UnboundArrayNode
     
-    def _childgetter(self):
-        return self.value.__getitem__
-    def _childsetter(self):
-        return self.value.__setitem__
+    def _childaccessors(self, obj, idx):
+        def valueget():
+            return obj[idx]
+        def valueset(val):
+            obj[idx] = val
+        return valueget, valueset
     
 class BoundBitfieldNode(BoundStructureNode):
+    __slots__ = ()
     _unboundtype = UnboundBitfieldNode
+
+# _createunbound always produces exactly one of the UnboundNode classes, so
+# the matching BoundNode class can be looked up straight from its type.
+_boundtypes = dict(
+    (t._unboundtype, t) for t in
+        (BoundSimpleNode, BoundStructureNode, BoundArrayNode, BoundBitfieldNode)
+)
     
 #############################################################################
 # Structure walker/printers.  These make good demonstrations of function.
@@ -486,16 +611,35 @@ def findnode(obj, path=''):
         node = _createbound(obj)
     
     # And walk it down.
-    pathparts = re.split(r'\]?(?:[[.]|$)', path)
-    for part in pathparts:
-        if not part:    continue
-        try:
-            idx = int(part)
-            node = node[idx]
-        except ValueError:
-            node = node[part]
+    for part in _splitpath(path):
+        node = node[part]
     return node
 
+# Each part of a path is either an array index like '[2]' or a field name,
+# which is normally preceded by a '.' but doesn't have to be at the start.
+# A dotted part that's all digits, as in 'window.2', is also an index.
+_pathtoken = re.compile(r'\[(\d+)\]|\.?([^.[\]]+)')
+
+def _splitpath(path):
+    """Split a path such as '.overhead.window[2].page' into a list of
+    field names and integer indices, e.g. ['overhead', 'window', 2, 'page'].
+    
+    Indices can also be written as dotted parts, so '.overhead.window.2.page'
+    splits the same way.
+    """
+    parts = []
+    pos = 0
+    while pos < len(path):
+        m = _pathtoken.match(path, pos)
+        if m is None:
+            raise ValueError('Bad path {0!r} at position {1}'.format(path, pos))
+        idx, name = m.groups()
+        if idx is None and name.isdigit():
+            idx = name
+        parts.append(name if idx is None else int(idx))
+        pos = m.end()
+    return parts
+
 def offsetof(obj, path):
     """Calculate the byte offset of a given path into a ctypes-derived class.
     
@@ -521,30 +665,25 @@ def display(obj, skiphidden=True, **printargs):
     maxhex = len(hex(ctypes.sizeof(top.type))) - 2
     def addrformat(addr):
         if isinstance(addr, int):
-            return "0x{0:0{1}X}".format(addr, maxhex)
+            return '0x%0*X' % (maxhex, addr)
         else:
             intpart = int(addr)
-            fracbits = int((addr - intpart) * 8)
-            return "0x{0:0{1}X}'{2}".format(intpart, maxhex, fracbits)
+            return "0x%0*X'%d" % (maxhex, intpart, (addr - intpart) * 8)
     
-    def formatval(here):
-        if isinstance(here, BoundSimpleNode):
-            return "{0}({1})".format(here.type.__name__, here.value)
-        else:
-            return str(here.value)
-
     if isinstance(top, UnboundNode):
         headers = ['Path', 'Addr', 'Type']
-        results = [
-            (('  ' * n.depth) + n.name, addrformat(n.baseoffset), n.type.__name__)
-                for n in walknode(top, skiphidden)
-        ]
+        def row(n):
+            return (('  ' * n.depth) + n.name, addrformat(n.baseoffset), n.type.__name__)
     else:
         headers = ['Path', 'Addr', 'Value']
-        results = [
-            (('  ' * n.depth) + n.name, addrformat(n.baseoffset), formatval(n))
-                for n in walknode(top, skiphidden)
-        ]
+        def row(n):
+            if isinstance(n, BoundSimpleNode):
+                val = '%s(%s)' % (n.type.__name__, n.value)
+            else:
+                val = str(n.value)
+            return (('  ' * n.depth) + n.name, addrformat(n.baseoffset), val)
+    
+    results = [row(n) for n in walknode(top, skiphidden)]
         
     #-------------------------------------------------------------------
     # Determine the maximum width of the text in each column, make the
@@ -556,15 +695,25 @@ def display(obj, skiphidden=True, **printargs):
     ]
     
     #-------------------------------------------------------------------
-    # Print out the tabular data.
-    
-    def lp(args):
-        print(*args, **printargs)
+    # Print out the tabular data.  Rather than a print per row, build it
+    # all up into one string, using the same separators print would have.
+    
+    sep = printargs.pop('sep', None)
+    if sep is None:
+        sep = ' '
+    end = printargs.pop('end', None)
+    if end is None:
+        end = '\n'
         
-    lp(d.center(w) for d, w in zip(headers, widths))
-    lp('-' * w for w in widths)
-    for r in results:
-        lp(d.ljust(w) for d, w in zip(r, widths))
+    rowformat = sep.replace('{', '{{').replace('}', '}}').join(
+        '{{{0}:<{1}}}'.format(col, w) for col, w in enumerate(widths)
+    )
+    lines = [
+        sep.join(d.center(w) for d, w in zip(headers, widths)),
+        sep.join('-' * w for w in widths)
+    ]
+    lines.extend(rowformat.format(*r) for r in results)
+    print(end.join(lines), end=end, **printargs)
 
 def walknode(top, skiphidden=True):
     """Returns a recursive iterator over all Nodes under top.
@@ -572,13 +721,15 @@ def walknode(top, skiphidden=True):
     If skiphidden is True (the default) then structure branches starting with
     an underscore will be ignored.
     """
-    if skiphidden and top.name.startswith('._'):
-        return
-        
-    yield top
-    for child in top:
-        for c in walknode(child):
-            yield c
+    # Rather than recursing, keep our own stack of nodes still to visit.
+    # Children go onto it in reverse so they come back off in order.
+    stack = [top]
+    while stack:
+        node = stack.pop()
+        if skiphidden and node.name[:2] == '._':
+            continue
+        yield node
+        stack.extend(node[idx] for idx in range(len(node) - 1, -1, -1))
 
 def walk(obj, path='', skiphidden=True):
     """Returns a recursive iterator over all Nodes starting from
@@ -590,3 +741,57 @@ def walk(obj, path='', skiphidden=True):
     
     node = findnode(obj, path)
     return walknode(node, skiphidden)
+
+#############################################################################
+# Flattened trees, for asking lots of questions about the same class.
+#############################################################################
+
+CompiledTree = namedtuple('CompiledTree',
+    'names types offsets sizes parents depths leaf_mask'
+)
+CompiledTree.__doc__ = """A flattened walk of a ctypes-derived class.
+
+Each field is a tuple with one entry per node, in the order walk() would
+visit them, so that the root is entry 0.
+
+names       The local name of each node, as Node.name
+types       The type of each node
+offsets     The offset of each node from the root, as Node.baseoffset
+sizes       The size of each node, as Node.size
+parents     The index of each node's parent, or -1 for the root
+depths      The depth of each node, as Node.depth
+leaf_mask   True for each node that has no children
+"""
+
+_compiledtrees = {}
+
+def compile_tree(obj, skiphidden=True):
+    """Return a CompiledTree for obj, where obj is either a ctypes-derived
+    class or an instance of such a class.
+    
+    The tree only depends on the class, so it is built once per class and
+    the same CompiledTree returned thereafter.  If skiphidden is True (the
+    default) then structure branches starting with an underscore will be
+    left out, as with walk.
+    """
+    kls = obj if isclass(obj) else _referenceclass(obj)
+    try:
+        return _compiledtrees[kls, skiphidden]
+    except KeyError:
+        pass
+        
+    nodes = list(walknode(_createunbound(kls), skiphidden))
+    index = dict((id(n), i) for i, n in enumerate(nodes))
+    tree = CompiledTree(
+        names = tuple(n.name for n in nodes),
+        types = tuple(n.type for n in nodes),
+        offsets = tuple(n.baseoffset for n in nodes),
+        sizes = tuple(n.size for n in nodes),
+        parents = tuple(
+            -1 if n.parent is None else index[id(n.parent)] for n in nodes
+        ),
+        depths = tuple(n.depth for n in nodes),
+        leaf_mask = tuple(not len(n) for n in nodes)
+    )
+    _compiledtrees[kls, skiphidden] = tree
+    return tree
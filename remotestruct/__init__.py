@@ -46,6 +46,25 @@ representation; these bytes could be parts of strings, floats, or integers.
 The binary data for the readBytes and writeBytes methods is not required to
 be mutable; either bytes() or bytearray() data may be provided.
 
+A handler may also provide a ``readBytesInto(addr, size, buf, offset)``
+method, which reads size bytes from addr into buf starting at buf[offset]
+rather than returning a new object.  This is optional, but where it exists
+the CachedHandler will use it to read directly into its own buffers.
+CachedHandler provides a readBytesInto method of its own as well.
+
+Likewise a handler may provide ``readBytesUnpack(addr, st)``, which returns
+the st.size bytes at addr unpacked with the struct.Struct st.  Simple data
+fields are read with it where it exists; CachedHandler's unpacks straight
+out of the cache line on a hit.
+
+Transports that can move several separate blocks in one transaction can
+provide ``readMany(requests)`` and ``writeMany(writes)`` methods as well.
+readMany takes a list of (addr, size) pairs and returns a list of the data
+for each, writeMany takes a list of (addr, data) pairs.  These are also
+optional; the getFields and setFields functions, and non-contiguous slices
+of RemoteArrays, use them where they exist and fall back to a readBytes or
+writeBytes per block where they don't.
+
 Remote Classes
 --------------
 
@@ -166,6 +185,25 @@ representation; these bytes could be parts of strings, floats, or integers.
 The binary data for the readBytes and writeBytes methods is not required to
 be mutable; either bytes() or bytearray() data may be provided.
 
+A handler may also provide a ``readBytesInto(addr, size, buf, offset)``
+method, which reads size bytes from addr into buf starting at buf[offset]
+rather than returning a new object.  This is optional, but where it exists
+the CachedHandler will use it to read directly into its own buffers.
+CachedHandler provides a readBytesInto method of its own as well.
+
+Likewise a handler may provide ``readBytesUnpack(addr, st)``, which returns
+the st.size bytes at addr unpacked with the struct.Struct st.  Simple data
+fields are read with it where it exists; CachedHandler's unpacks straight
+out of the cache line on a hit.
+
+Transports that can move several separate blocks in one transaction can
+provide ``readMany(requests)`` and ``writeMany(writes)`` methods as well.
+readMany takes a list of (addr, size) pairs and returns a list of the data
+for each, writeMany takes a list of (addr, data) pairs.  These are also
+optional; the getFields and setFields functions, and non-contiguous slices
+of RemoteArrays, use them where they exist and fall back to a readBytes or
+writeBytes per block where they don't.
+
 Remote Classes
 --------------
 
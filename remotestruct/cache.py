@@ -3,9 +3,17 @@ Caching structures for supporting data prefetch/cache on RemoteStructs.
 """
 
 from time import time
+from collections import OrderedDict
 
 from .sparserange import SparseRange
 
+try:
+	_move_to_end = OrderedDict.move_to_end
+except AttributeError:
+	# Python 2 OrderedDicts can only do it by reinserting.
+	def _move_to_end(od, key):
+		od[key] = od.pop(key)
+
 class CacheLine(object):
 	"""Implements a single CacheLine, linebytes (default 32) bytes long.
 	
@@ -13,66 +21,98 @@ class CacheLine(object):
 		data
 			A fixed length bytearray used to hold the most recent data
 			
-		last
+		lastupdate
 			The time() the last time the line was updated.
 			
 		range
 			A SparseRange marking the range encompassed by this CacheLine.
 			data[n] is the byte at address (range.min + n)
+			
+		start
+			range.min, kept as a plain integer.
+			
+		stop
+			One past range.max as a plain integer if range is contiguous,
+			otherwise None.
 	
+	Other than update, which takes a SparseRange, CacheLine methods
+	take their addresses as plain integers, with stop being one past
+	the last address in the usual fashion.
 	"""
 	
+	# CacheLine methods get called on every cache access, so keep the
+	# attribute lookups in them as cheap as possible.
+	__slots__ = ('data', '_mv', 'lastupdate', 'range', 'start', 'stop')
+	
 	def __init__(self, linebytes=32):
 		self.data = bytearray(linebytes)
-		self.lastread = self.lastupdate = 0
+		self._mv = memoryview(self.data)
+		self.lastupdate = 0
 		self.range = SparseRange()
+		self.start = self.stop = None
 		
 	def invalidate(self):
 		"""Mark this line as invalid."""
 		self.range.clear()
+		self.start = self.stop = None
 		
-	def hit(self, request):
+	def hit(self, start, stop):
 		"""
-		Test whether the request can be	served by this CacheLine.
-		
-		request
-			The address range to search for as a SparseRange
+		Test whether the addresses from start to stop can be served by
+		this CacheLine.
 		"""
-		return self.range.issuperset(request)
+		if self.stop is not None:
+			return self.start <= start and stop <= self.stop
+		return self.range._contains_pair(start, stop)
 
-	def offset(self, rng):
-		"""Find the offset of rng.min in this CacheLine."""
-		return rng.min() - self.range.min()
+	def offset(self, start):
+		"""Find the offset of address start in this CacheLine."""
+		return start - self.start
 		
-	def update(self, rng, data):
+	def update(self, rng, data, now=None):
 		"""
 		Replace the CacheLine with the new range and data.  This
-		refreshes read and update timestamps.
+		refreshes the update timestamp, to now if given.
+		
+		The data is copied into the existing buffer rather than replacing
+		it, so rng can't span more than the linebytes the CacheLine was
+		created with.
 		"""
 		
-		assert rng.span() == len(data)
-		self.lastread = self.lastupdate = time()
-		self.data = bytearray(data)
+		assert rng.span() == len(data) <= len(self.data)
+		self.lastupdate = time() if now is None else now
+		self.data[:len(data)] = data
 		self.range = rng
+		self.start = rng.min()
+		self.stop = (self.start + len(data)) if rng.contiguous() else None
 		
-	def write(self, rng, data):
+	def write(self, start, data):
 		"""
 		Replace part of the CacheLine with new data, keeping the
 		same range.  This refreshes no timestamps, since some of the
 		other data in the line could be getting old.
 		"""
-		assert rng.span() == len(data)
-		offset = self.offset(rng)
+		offset = start - self.start
 		self.data[offset:offset+len(data)] = data
 		
-	def read(self, rng):
+	def read(self, start, stop):
 		"""
-		Return data from the CacheLine.  This refreshes the read timestamp.
+		Return data from the CacheLine as a memoryview.
+		
+		The memoryview is of the live CacheLine data, so copy it out before
+		the CacheLine can be changed.
+		"""
+		
+		offset = start - self.start
+		return self._mv[offset:offset+stop-start]
+		
+	def unpack_from(self, st, start):
+		"""
+		Return the data at address start unpacked with the struct.Struct st,
+		without copying it out first.
 		"""
 		
-		self.lastread = time()
-		offset = self.offset(rng)
-		return self.data[offset:offset+rng.span()]
+		return st.unpack_from(self._mv, start - self.start)
 		
 		
 class CacheMiss(Exception):
@@ -83,6 +123,8 @@ class CacheTimeout(Exception):
 		
 class Cache(object):
 	"""
+	A collection of up to sets CacheLines, each holding the data from one
+	linebytes aligned block of addresses.
 	
 	timeout
 		Set to 0 for no caching, None to never time out, or a positive
@@ -100,84 +142,126 @@ class Cache(object):
 	
 	def __init__(self, sets=8, linebytes=32, timeout=None, stats=True):
 		self.timeout = timeout
+		self.sets = sets
+		self.linebytes = linebytes
+		self._mask = -linebytes
 		
 		# Manage the statistics
-		if stats:
-			self.log = self._log
-		else:
-			self.log = lambda x : None
+		self._stats = stats
 		self.clearstats()
 		
-		# Configure all the cache line information.
-		self._sets = [CacheLine(linebytes) for x in range(sets)]
-		self.invalidate()
+		# CacheLines are kept keyed by the aligned address they start at, so
+		# finding the only line that could hold a request is a dict lookup.
+		# The OrderedDict is also kept in order of use, so the least recently
+		# used line is always the first one.
+		self._lines = OrderedDict()
 		
 	def clearstats(self):
 		"""Clear the cache statistics."""
 		self.hits = self.misses = self.timeouts = 0
 		
 	def invalidate(self):
-		for line in self._sets:
-			line.invalidate()
-		self._lru = self._sets[-1]
-		self._lastmiss = SparseRange()
-		
-	def _log(self, key):
-		setattr(self, key, getattr(self, key)+1)
+		self._lines.clear()
 		
-	def search(self, rng):
-		"""Find the CacheLine for this range or raise an exception."""
+	def search(self, start, stop, now=None):
+		"""Find the CacheLine for the addresses from start to stop or raise
+		an exception.  now is the time to check the timeout against, if
+		the caller already has it to hand."""
 		if self.timeout == 0:
 			raise CacheMiss()
 		
-		# While we search through the CacheLines, take the opportunity to
-		# update the lru pointer.  Has to happen sometime, right?
-		for line in self._sets:
-			if line.hit(rng):
-				if self.timeout is not None and time() > (line.lastupdate + self.timeout):
-					self._lru = line
-					raise CacheTimeout()
-				return line
-				
-			if line.lastread < self._lru.lastread:
-				self._lru = line
-		else:
+		line = self._lines.get(start & self._mask)
+		if line is None or not line.hit(start, stop):
 			raise CacheMiss()
+		if self.timeout is not None:
+			if now is None:
+				now = time()
+			if now > (line.lastupdate + self.timeout):
+				raise CacheTimeout()
+		return line
 		
-	def read(self, rng):
-		"""Return the data from the cache or None."""
+	def _lookup(self, start, stop, now):
+		"""Return the CacheLine to read start to stop from, or None, keeping
+		the statistics and order of use up to date."""
 		try:
-			line = self.search(rng)
-			self.log('hits')
-			return line.read(rng)
+			line = self.search(start, stop, now)
 		except (CacheMiss, CacheTimeout) as e:
-			self._lastmiss = rng
-			self.log(e.stat)
+			if self._stats:
+				setattr(self, e.stat, getattr(self, e.stat)+1)
+			return None
+			
+		# Move the line to the most recently used end.
+		_move_to_end(self._lines, start & self._mask)
+		if self._stats:
+			self.hits += 1
+		return line
+		
+	def read(self, start, stop, now=None):
+		"""Return the data from the cache or None."""
+		line = self._lookup(start, stop, now)
+		if line is None:
 			return None
+		return line.read(start, stop)
+		
+	def unpack(self, st, start, now=None):
+		"""Return the data at address start from the cache unpacked with the
+		struct.Struct st, or None."""
+		line = self._lookup(start, start + st.size, now)
+		if line is None:
+			return None
+		return line.unpack_from(st, start)
 
-	def update(self, rng, data):
+	def update(self, rng, data, now=None):
 		"""
 		Call this to fill a CacheLine with new data after a missed read.
 		Returns the newly filled CacheLine.
 		"""
-		assert rng >= self._lastmiss
-		line = self._lru
-		self._lru = self._sets[-1]
-		self._lastmiss = None
+		# Replace any existing line for this address, otherwise take over the
+		# least recently used line once all the sets are in use.
+		key = rng.min() & self._mask
+		line = self._lines.pop(key, None)
+		if line is None:
+			if len(self._lines) >= self.sets:
+				_, line = self._lines.popitem(last=False)
+			else:
+				line = CacheLine(self.linebytes)
 		
-		line.update(rng, data)
+		line.update(rng, data, now)
+		self._lines[key] = line
 		return line
 
-	def write(self, rng, data):
-		"""If we already have a CacheLine loaded for this range then update
-		the data in it.  If not, ignore it.
+	def write(self, start, data, now=None):
+		"""If we already have a CacheLine loaded for these addresses then
+		update the data in it.  If not, ignore it.
 		"""
 		try:
 			# Try to save ourselves a search.
-			line = self.search(rng)
-			line.write(rng, data)
+			line = self.search(start, start+len(data), now)
+			line.write(start, data)
 		except (CacheMiss, CacheTimeout):
 			pass
+			
+class _NullCache(Cache):
+	"""
+	A Cache for a timeout of 0, which never holds on to anything.  Every
+	read is a miss, and writes are ignored.
+	"""
+	
+	def __init__(self, sets=8, linebytes=32, timeout=0, stats=True):
+		super(_NullCache, self).__init__(sets, linebytes, timeout, stats)
+		
+		# The one CacheLine that update fills and hands back each time.
+		self._line = CacheLine(linebytes)
+		
+	def search(self, start, stop, now=None):
+		raise CacheMiss()
+		
+	def update(self, rng, data, now=None):
+		self._line.update(rng, data, now)
+		return self._line
+		
+	def write(self, start, data, now=None):
+		pass
 
 class CachedHandler(object):
 	"""
@@ -195,9 +279,35 @@ class CachedHandler(object):
 	it.  The next time data from that cache line is requested, the cached data
 	will be returned, rather than having to to through the real handler.
 	
+	When a single read misses on several adjacent cache lines, all of those
+	lines are fetched from the real handler in one transaction rather than
+	one transaction per line.  The max_coalesce_lines attribute (default 8)
+	caps how many lines can be fetched together.
+	
+	Setting the readahead attribute to a number of lines (default 0, off)
+	lets the CachedHandler spot data being read through in order.  When a
+	miss starts on the line just after the last lines fetched, up to that
+	many of the following lines are fetched along with it in the same
+	transaction, so a sequential scan takes one read every readahead lines
+	rather than one read per line.  Lines that touch nocache or noprefetch,
+	or are already in the cache, are never read ahead.  Nor are lines that
+	go past the readahead_limit attribute, the address just past the end of
+	the target; with the default of None there is no limit, so set it
+	before turning readahead on for a target that can't be read past its
+	end.
+	
+	If the real handler can safely take several requests at once from
+	different threads, the executor attribute can be set to an executor,
+	such as a concurrent.futures.ThreadPoolExecutor.  Then when a read misses
+	on several separate runs of cache lines, they are all read at the same
+	time on the executor rather than one after another.  Reads from cache
+	lines that touch nocache or noprefetch are never made this way.  The
+	default of None reads everything in order on the calling thread.
+	
 	As data is written, any data that is in the cache is also updated.  Data
 	writes are not aggregated by the caching logic and always take place
-	immediately on the real handler.
+	immediately on the real handler, each as a single write no matter how
+	many cache lines it covers.
 	
 	As more data is requested, eventually less recently used data in the cache
 	will be replaced by newer data.
@@ -252,31 +362,68 @@ class CachedHandler(object):
 		
 		self.handler = handler
 		self.linebytes = linebytes
-		self.cache = Cache(sets, linebytes, timeout, stats)
+		
+		# Cache line arithmetic is all done with this.
+		self._mask = -linebytes
+		
+		self.cache = self._cacheclass(timeout)(sets, linebytes, timeout, stats)
+		self.max_coalesce_lines = 8
+		self.readahead = 0
+		self.readahead_limit = None
+		self.executor = None
+		
+		# The line just after the last run of lines fetched, which is where
+		# the next miss will be if the data is being read through in order.
+		self._nextline = None
 		
 		self.nocache = SparseRange()
 		self.noprefetch = SparseRange()
 		
+		# Scratch space for reading in cache lines that have to be read in
+		# pieces, rather than allocating new space for each one.
+		self._linebuf = bytearray(linebytes)
+		
+		# And for runs of cache lines read together, which grows as needed.
+		self._fillbuf = bytearray()
+		
+		# Whether each cache line touches nocache and noprefetch, and the
+		# state of both lists those answers are good for.
+		self._linemasks = {}
+		self._maskstate = None
+		
 	def _rounduptoline(self, val):
 		"""Round up to the next higher multiple of linebytes."""
-		lb = self.linebytes
-		return (val + lb - 1) & -lb
+		mask = self._mask
+		return (val + ~mask) & mask
 		
 	def _rounddowntoline(self, val):
 		"""Round down to the next lower multiple of linebytes."""
-		return val & -self.linebytes
+		return val & self._mask
 		
 	def _split_cachelines(self, addr, size):
-		"""Iterate over ranges guaranteed to not cross a cache-line boundary."""
-		full = SparseRange(addr, addr+size)
-		
-		# Round the min and max up to the next linebytes boundary.
-		low = self._rounduptoline(full.min())
-		high = self._rounduptoline(full.max())
-		
-		# Divide it up.
-		splitpoints = range(low, high, self.linebytes)
-		return (r for r in full.split(splitpoints) if r)
+		"""Iterate over (start, stop) pairs guaranteed to not cross a
+		cache-line boundary."""
+		mask = self._mask
+		linebytes = self.linebytes
+		end = addr + size
+		while addr < end:
+			stop = (addr & mask) + linebytes
+			if stop > end:
+				stop = end
+			yield addr, stop
+			addr = stop
+		
+	def _handler_read(self, addr, size, buf, offset=0):
+		"""Read size bytes from addr on the real handler into buf at offset.
+		
+		Uses the handler's readBytesInto if it has one, otherwise copies in
+		the results of its readBytes.
+		"""
+		readinto = getattr(self.handler, 'readBytesInto', None)
+		if readinto is None:
+			buf[offset:offset+size] = self.handler.readBytes(addr, size)
+		else:
+			readinto(addr, size, buf, offset)
 		
 	def _read_safely(self, needed, desired, target=None, targetoffset=0):
 		"""Return the desired data from the handler in as few reads as possible.
@@ -289,21 +436,15 @@ class CachedHandler(object):
 		targetoffset is the offset into target to put the new data
 		"""		
 		
-		# Alright, start with the big optimization that catches 99% of cases.
-		if needed == desired:
-			d = self.handler.readBytes(needed.min(), needed.span())
-			if target is not None:
-				target[targetoffset:targetoffset+len(d)] = d
-			return d
-			
 		# Ideally, we'd do one big read, but the noprefetch can force us to
 		# split around that unless the non-prefetchable thing is actually
 		# in the desired data.
-		desired -= self.noprefetch
-		desired |= needed
-		for reg in desired.subranges():
-			if reg.isdisjoint(needed):
-				desired -= reg
+		if needed != desired:
+			desired -= self.noprefetch
+			desired |= needed
+			for reg in desired.subranges():
+				if reg.isdisjoint(needed):
+					desired -= reg
 		
 		if target is None:
 			target = bytearray(desired.span())
@@ -313,61 +454,316 @@ class CachedHandler(object):
 		# Go do all the contiguous reads, leaving padding between.		
 		baseoffset = desired.min() - targetoffset
 		for (start, stop) in desired.pairs():
-			offset = start - baseoffset
-			d = self.handler.readBytes(start, stop-start)
-			target[offset:offset+len(d)] = d
+			self._handler_read(start, stop-start, target, start - baseoffset)
 			
 		return target
 		
+	def _fill_lines(self, misses, out, now=None):
+		"""Fill the cache lines for a run of adjacent cache misses with a
+		single read from the handler.
+		
+		misses is a list of (pos, start, stop) tuples, one per cache line,
+		where the data for addresses start to stop belongs at out[pos].  It
+		is emptied once out is filled in.
+		
+		now is passed on as the time the lines were updated.
+		"""
+		lb = self.linebytes
+		first = misses[0][1] & self._mask
+		ahead = 0
+		if self.readahead and first == self._nextline:
+			ahead = self._readahead_lines(first + len(misses) * lb, len(misses), now)
+		
+		size = (len(misses) + ahead) * lb
+		if len(self._fillbuf) < size:
+			self._fillbuf = bytearray(size)
+		data = self._read_run(misses, self._fillbuf, ahead)
+		self._store_run(misses, data, out, now)
+		
+		if len(data) > len(misses) * lb:
+			data = memoryview(data)
+			for n in range(len(misses), len(misses) + ahead):
+				x = first + n*lb
+				linedata = data[n*lb:(n+1)*lb]
+				if linedata:
+					self.cache.update(SparseRange(x, x+len(linedata)), linedata, now)
+		self._nextline = first + size
+		del misses[:]
+		
+	def _readahead_lines(self, line, count, now):
+		"""Return how many lines, starting at address line, can be read
+		ahead of a run of count missed lines."""
+		if self.timeout == 0:
+			return 0
+		limit = min(self.readahead, self.cache.sets - count)
+		masked = bool(self.nocache or self.noprefetch)
+		if masked:
+			self._check_masks()
+		lb = self.linebytes
+		end = self.readahead_limit
+		ahead = 0
+		while ahead < limit:
+			if end is not None and line + lb > end:
+				break
+			if masked and self._linemask(line) != (False, False):
+				break
+			try:
+				self.cache.search(line, line + lb, now)
+				break
+			except (CacheMiss, CacheTimeout):
+				pass
+			ahead += 1
+			line += lb
+		return ahead
+		
+	def _read_run(self, misses, data, ahead=0):
+		"""Read the cache lines for a run of misses, and ahead lines after
+		them, from the handler into the bytearray data, and return it.
+		
+		If the handler comes back with less than was asked for, such as
+		at the end of the target, a copy of just what it did send back is
+		returned instead.
+		"""
+		first = misses[0][1] & self._mask
+		size = (len(misses) + ahead) * self.linebytes
+		spare = len(data) - size
+		self._handler_read(first, size, data)
+		
+		# A short read shrinks data, rather than filling all of it.
+		got = len(data) - spare
+		if got < size:
+			return data[:got]
+		return data
+		
+	def _store_run(self, misses, data, out, now):
+		"""Put the data read by _read_run into the cache, and copy the
+		requested parts of it to out.  Lines that only partly came back
+		are cached as far as they go, and missing data is left alone in
+		out."""
+		lb = self.linebytes
+		first = misses[0][1] & self._mask
+		data = memoryview(data)
+		for n, (pos, start, stop) in enumerate(misses):
+			x = first + n*lb
+			linedata = data[n*lb:(n+1)*lb]
+			if not linedata:
+				break
+			line = self.cache.update(SparseRange(x, x+len(linedata)), linedata, now)
+			stop = min(stop, x + len(linedata))
+			if stop > start:
+				out[pos:pos+stop-start] = line.read(start, stop)
+			
+	def _finish_run(self, misses, runs, out, now):
+		"""Deal with a complete run of misses.  If runs is None it's filled
+		right away with _fill_lines, otherwise it's put on the runs list to
+		be filled later by _fill_runs.  Returns an empty list for the next
+		run.
+		"""
+		if runs is None:
+			self._fill_lines(misses, out, now)
+			return misses
+		runs.append(misses)
+		return []
+		
+	def _fill_runs(self, runs, out, now):
+		"""Fill in several runs of misses at once, reading them from the
+		handler in parallel on the executor."""
+		lb = self.linebytes
+		futures = [
+			self.executor.submit(self._read_run, misses, bytearray(len(misses) * lb))
+			for misses in runs
+		]
+		for misses, f in zip(runs, futures):
+			self._store_run(misses, f.result(), out, now)
+		
+	def _check_masks(self):
+		"""Forget the results of _linemask if nocache or noprefetch have
+		changed since they were worked out."""
+		state = (self.nocache._ranges, self.noprefetch._ranges)
+		if state != self._maskstate:
+			self._maskstate = (list(state[0]), list(state[1]))
+			self._linemasks.clear()
+			
+	def _linemask(self, line):
+		"""Return a (nocache, noprefetch) pair of whether anything in the
+		cache line starting at address line is on those lists.
+		
+		The answers are remembered, so call _check_masks first.
+		"""
+		try:
+			return self._linemasks[line]
+		except KeyError:
+			rng = range(line, line + self.linebytes)
+			m = self._linemasks[line] = (
+				not self.nocache.isdisjoint(rng),
+				not self.noprefetch.isdisjoint(rng)
+			)
+			return m
+		
 	def readBytes(self, addr, size):
-		# We need to break the read request up into cacheline aligned requests.
-		results = []
+		out = bytearray(size)
+		self.readBytesInto(addr, size, out)
+		return out
+		
+	def readBytesInto(self, addr, size, buf, offset=0):
+		"""Read size bytes from addr into buf, starting at buf[offset].
 		
-		for request in self._split_cachelines(addr, size):
+		buf can be anything that supports slice assignment of bytes, such as
+		a bytearray or a writable memoryview.
+		"""
+		
+		# Unless there's something on the nocache or noprefetch lists
+		# anywhere in the cache lines we're about to touch, we can work
+		# entirely with plain integer addresses.
+		if self.nocache or self.noprefetch:
+			self._check_masks()
+			for line in range(addr & self._mask, addr + size, self.linebytes):
+				if self._linemask(line) != (False, False):
+					return self._readBytesInto_masked(addr, size, buf, offset)
+		
+		# One timestamp serves for the entire request, and every address
+		# has its place in buf at address - base.
+		now = time()
+		base = addr - offset
+		misses = []
+		runs = None if self.executor is None else []
+		cache = self.cache
+		for start, stop in self._split_cachelines(addr, size):
+			data = cache.read(start, stop, now)
+			if data is None:
+				if len(misses) >= self.max_coalesce_lines:
+					misses = self._finish_run(misses, runs, buf, now)
+				misses.append((start - base, start, stop))
+			else:
+				# data is a view of the live CacheLine, which filling the
+				# run of misses could reuse, so copy it out first.
+				buf[start-base:stop-base] = data
+				if misses:
+					misses = self._finish_run(misses, runs, buf, now)
+				
+		if misses:
+			self._finish_run(misses, runs, buf, now)
+		if runs:
+			self._fill_runs(runs, buf, now)
+		
+	def _readBytesInto_masked(self, addr, size, buf, offset):
+		"""readBytesInto for when some of the addresses are on the nocache
+		or noprefetch lists.  Needs _check_masks to have been called."""
+		
+		# We need to break the read request up into cacheline aligned requests,
+		# each of which gets copied straight into its place in buf.
+		now = time()
+		base = addr - offset
+		
+		# Misses on lines that can be prefetched in their entirety are put
+		# off, so that a run of them can be read in a single transaction.
+		misses = []
+		
+		for start, stop in self._split_cachelines(addr, size):
 			# So, the most likely case is that size is small, and that the
 			# entire data is colletively either cacheable or not.
 			# Let's optimize for that case.
 			
-			uncacheable = request & self.nocache
+			request = SparseRange(start, stop)
+			x = start & self._mask
+			nocache, noprefetch = self._linemask(x)
+			uncacheable = (request & self.nocache) if nocache else SparseRange()
+			if request != uncacheable:
+				# Check to see whether the data is in the cache.
+				data = self.cache.read(start, stop, now)
+				if data is None:
+					linerange = SparseRange(x, x+self.linebytes)
+					if not noprefetch:
+						if len(misses) >= self.max_coalesce_lines:
+							self._fill_lines(misses, buf, now)
+						misses.append((start - base, start, stop))
+						continue
+				else:
+					# data is a view of the live CacheLine, and filling
+					# the misses below could reuse that line for another
+					# address, so it has to be copied out first.
+					buf[start-base:stop-base] = data
+			
+			# Anything else breaks up the run of misses, which have to be
+			# read before we go back to the handler for anything else.
+			if misses:
+				self._fill_lines(misses, buf, now)
+			
+			pos = start - base
 			if request == uncacheable:
 				# If the entire request can't be read from cache, there's
 				# no reason to mess around writing it in either.
-				data = self.handler.readBytes(request.min(), request.span())
+				self._handler_read(start, stop-start, buf, pos)
+				
+			elif data is None:
+				# We've got a cache miss on a line that needs to be read
+				# around the noprefetch addresses.
+				self._read_safely(
+					needed = request,
+					desired = linerange,
+					target = self._linebuf
+				)
+				linedata = memoryview(self._linebuf)[:linerange.span()]
+				line = self.cache.update(linerange, linedata, now)
+				buf[pos:pos+stop-start] = line.read(start, stop)
 				
 			else:
-				# Check to see whether the data is in the cache.
-				data = self.cache.read(request)
-				if not data:
-					# We've got a cache miss, time to go pull the data for the line
-					x = self._rounddowntoline(request.min())
-					linerange = SparseRange(x, x+self.linebytes)
-					linedata = self._read_safely(
-						needed = request,
-						desired = linerange
-					)
-					line = self.cache.update(linerange, linedata)
-					data = line.read(request)
-					
-				elif uncacheable:
-					# We got some from the cache, but we need to pick some of
-					# the rest up fresh.
+				if uncacheable.contiguous():
+					# We got some from the cache, but we need to pick the
+					# rest up fresh, which takes just the one read.
+					if uncacheable:
+						ustart = uncacheable.min()
+						self._handler_read(ustart, uncacheable.span(), buf, ustart-base)
+				else:
+					# As above, but from more than one place.
 					self._read_safely(
 						needed = uncacheable,
 						desired = uncacheable.spanningrange(),
-						target = data,
-						targetoffset = uncacheable.min()-request.min()
+						target = buf,
+						targetoffset = uncacheable.min() - base
 					)
-
-			results.append(data)
-		return bytearray().join(results)
 			
+		if misses:
+			self._fill_lines(misses, buf, now)
+			
+	def readBytesUnpack(self, addr, st):
+		"""Read st.size bytes from addr, and return them unpacked with the
+		struct.Struct st.
+		
+		When the data is all in the cache, it's unpacked from there without
+		being copied out first.
+		"""
+		size = st.size
+		line = addr & self._mask
+		if line == (addr + size - 1) & self._mask:
+			if self.nocache or self.noprefetch:
+				self._check_masks()
+				clean = (self._linemask(line) == (False, False))
+			else:
+				clean = True
+				
+			if clean:
+				now = time()
+				values = self.cache.unpack(st, addr, now)
+				if values is None:
+					buf = bytearray(size)
+					self._fill_lines([(0, addr, addr+size)], buf, now)
+					values = st.unpack(buf)
+				return values
+		
+		# Anything more complicated gets read the usual way.
+		return st.unpack(self.readBytes(addr, size))
+		
 	def writeBytes(self, addr, data):
-		# We need to break the write request into cacheline aligned requests.
-		start = 0
-		for request in self._split_cachelines(addr, len(data)):
-			d = data[start:start+request.span()]
-			self.cache.write(request, d)
-			self.handler.writeBytes(request.min(), d)
+		# The cache has to be updated one cache line at a time, but the write
+		# itself is contiguous and can go out to the handler in one piece.
+		# Slicing the pieces for the cache out of a memoryview means they get
+		# copied straight into the CacheLines with no intermediate copy.
+		now = time()
+		mv = memoryview(data)
+		for start, stop in self._split_cachelines(addr, len(data)):
+			self.cache.write(start, mv[start-addr:stop-addr], now)
+		self.handler.writeBytes(addr, data)
 			
 	@property
 	def timeout(self):
@@ -375,7 +771,20 @@ class CachedHandler(object):
 		
 	@timeout.setter
 	def timeout(self, val):
-		self.cache.timeout = val 
+		# Changing to or from a timeout of 0 means changing to or from a
+		# _NullCache; the statistics are carried over.
+		old = self.cache
+		cls = self._cacheclass(val)
+		if type(old) is cls:
+			old.timeout = val
+		else:
+			self.cache = cls(old.sets, old.linebytes, val, old._stats)
+			self.cache.hits, self.cache.misses, self.cache.timeouts = old.hits, old.misses, old.timeouts
+			
+	@staticmethod
+	def _cacheclass(timeout):
+		"""The class of Cache to use for a given timeout."""
+		return _NullCache if timeout == 0 else Cache
 		
 	def stats(self):
 		"""Get the cache statistics as 3-tuple (hit, miss, timeout)."""
@@ -388,4 +797,5 @@ class CachedHandler(object):
 	def invalidate(self):
 		"""Dump the cache."""
 		self.cache.invalidate()
+		self._nextline = None
 	
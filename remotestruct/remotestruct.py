@@ -1,5 +1,9 @@
 from bitfield import *
 
+from bisect import bisect_right
+from contextlib import contextmanager
+import struct
+import sys
 import logging
 _log = logging.getLogger(__name__)
 
@@ -8,20 +12,6 @@ _log = logging.getLogger(__name__)
 # of cleverness.
 #######################################################################
 
-class _NullDecorator(object):
-    def __init__(self, *args, **kwargs):
-        pass
-        
-    def __call__(self, fn):
-        return fn
-
-try:
-    from functools import lru_cache
-except ImportError:
-    # lru_cache not available in this version of Python.  The performance
-    # enhancement is nice, but not essential.
-    lru_cache = _NullDecorator
-
 if bytes is str:
     byte_converter = bytearray
 else:
@@ -31,34 +21,290 @@ else:
 structure_basetype = type(Structure)
 simple_basetype = c_uint.__bases__[0]
 
-class _SubHandler(object):
+# The kinds of ctypes data that we know how to make remote.
+_SIMPLE, _BITFIELD, _STRUCT, _ARRAY = range(4)
+
+_basis_kinds = {}
+
+def _kind_of(basis):
     """
-    A passthrough handler that applies an offset
-    on top of another higher-level handler.
+    Return which of the kinds of ctypes data basis is.  This is asked
+    for every field of everything we make remote, so the answer is
+    cached per class.
     """
+    try:
+        return _basis_kinds[basis]
+    except KeyError:
+        pass
+        
+    # Bitfields are Unions as well, so they have to come first.
+    if issubclass(basis, Bitfield):
+        kind = _BITFIELD
+    elif issubclass(basis, Array):
+        kind = _ARRAY
+    elif issubclass(basis, (Structure, Union)):
+        kind = _STRUCT
+    elif issubclass(basis, simple_basetype):
+        kind = _SIMPLE
+    else:
+        raise TypeError("Can't translate " + basis.__name__)
+    _basis_kinds[basis] = kind
+    return kind
+
+# Scratch bytearrays for handlers that can readBytesInto, keyed by size.
+# from_buffer_copy copies the data straight back out, so a buffer is only
+# ever checked out for the length of one read.
+_buffer_pool = {}
+
+def _read_decode(decode, handler, addr, size):
+    """
+    Read size bytes from the handler at addr, and return the result of
+    calling decode on them.  decode must not hang on to its argument.
+    """
+    readinto = getattr(handler, 'readBytesInto', None)
+    if readinto is None:
+        return decode(handler.readBytes(addr, size))
+        
+    pool = _buffer_pool.setdefault(size, [])
+    try:
+        buf = pool.pop()
+    except IndexError:
+        buf = bytearray(size)
+    readinto(addr, size, buf)
+    result = decode(buf)
+    pool.append(buf)
+    return result
     
-    def __init__(self, handler, offset):
-        # Optimize for nested _SubHandlers by not bouncing
-        # through a zillion function calls if we can figure
-        # out how not to.
-        #
-        try:
-            if isinstance(handler, self.__class__):
-                self.handler = handler.handler
-                self.offset = handler.offset + offset
-                return
-                
-        except AttributeError:
-            pass
-            
+def _read_many(handler, requests):
+    """
+    Read a list of (addr, size) blocks from the handler, in a single
+    readMany transaction if the handler supports it.  Returns a list of
+    the data for each block.
+    """
+    readmany = getattr(handler, 'readMany', None)
+    if readmany is not None:
+        return readmany(requests)
+    return [handler.readBytes(addr, size) for addr, size in requests]
+    
+def _write_many(handler, writes):
+    """
+    Write a list of (addr, data) blocks to the handler, in a single
+    writeMany transaction if the handler supports it.
+    """
+    writemany = getattr(handler, 'writeMany', None)
+    if writemany is not None:
+        writemany(writes)
+    else:
+        for addr, data in writes:
+            handler.writeBytes(addr, data)
+
+class _WriteBatch(object):
+    """
+    A handler that wraps another one, and holds on to every write made
+    through it until flush() is called.  flush() joins writes that touch
+    or overlap into single blocks, later writes winning where they
+    overlap, and sends whatever blocks are left with _write_many.
+
+    Reads flush first, so they always see the writes made before them.
+    Once the batch is closed everything goes straight to the handler,
+    so RemoteX objects that outlive the batch still work.
+    """
+
+    __slots__ = ('handler', '_writes')
+
+    def __init__(self, handler):
         self.handler = handler
-        self.offset = offset
-        
+        self._writes = []
+
+    def writeBytes(self, addr, data):
+        if self._writes is None:
+            self.handler.writeBytes(addr, data)
+        else:
+            self._writes.append((addr, bytearray(data)))
+
+    def writeMany(self, writes):
+        for addr, data in writes:
+            self.writeBytes(addr, data)
+
     def readBytes(self, addr, size):
-        return self.handler.readBytes(addr + self.offset, size)
+        self.flush()
+        return self.handler.readBytes(addr, size)
+
+    def readBytesInto(self, addr, size, buf, offset=0):
+        self.flush()
+        readinto = getattr(self.handler, 'readBytesInto', None)
+        if readinto is None:
+            buf[offset:offset+size] = self.handler.readBytes(addr, size)
+        else:
+            readinto(addr, size, buf, offset)
+
+    def readMany(self, requests):
+        self.flush()
+        return _read_many(self.handler, requests)
+
+    def flush(self):
+        """Send all the held writes to the handler."""
+        writes = self._writes
+        if not writes:
+            return
+        self._writes = []
+
+        # Work out the extent of each block from the writes in address
+        # order, then fill them in from the writes in the order they
+        # were made.
+        starts = []
+        blocks = []
+        for addr, data in sorted(writes, key=lambda w: w[0]):
+            end = addr + len(data)
+            if blocks and addr <= starts[-1] + len(blocks[-1]):
+                block = blocks[-1]
+                if end > starts[-1] + len(block):
+                    block.extend(bytearray(end - starts[-1] - len(block)))
+            else:
+                starts.append(addr)
+                blocks.append(bytearray(len(data)))
+        for addr, data in writes:
+            i = bisect_right(starts, addr) - 1
+            start = addr - starts[i]
+            blocks[i][start:start+len(data)] = data
+        _write_many(self.handler, list(zip(starts, blocks)))
+
+    def close(self, send=True):
+        """
+        Flush, or drop the held writes if send is False, and pass
+        everything straight through from now on.
+        """
+        try:
+            if send:
+                self.flush()
+        finally:
+            self._writes = None
+
+def _read_copy(basis, handler, addr, size):
+    """
+    Read size bytes from the handler at addr, and return them as a new
+    instance of basis.
+    """
+    return _read_decode(basis.from_buffer_copy, handler, addr, size)
+    
+#######################################################################
+# Simple data goes through the struct module where it can, which is a
+# lot quicker than making a ctypes object just to get at its value.
+#######################################################################
+
+# The ctypes type codes that mean the same thing to struct.
+_struct_codes = 'bBhHiIlLqQfd?'
+
+_native_ctype = '__ctype_le__' if sys.byteorder == 'little' else '__ctype_be__'
+
+def _struct_for(basis):
+    """
+    Return a struct.Struct that packs and unpacks the same way as the
+    simple ctypes type basis, or None if there isn't one.
+    """
+    if basis.__bases__ != (simple_basetype,):
+        # Subclasses of the simple types don't get turned into Python
+        # values automatically, so leave them to ctypes.
+        return None
+    code = basis._type_
+    if code not in _struct_codes:
+        return None
         
-    def writeBytes(self, addr, data):
-        self.handler.writeBytes(addr + self.offset, data)
+    # The native byte order gets native sizes as well, which matters for
+    # things like c_long.
+    if getattr(basis, _native_ctype, basis) is basis:
+        order = '@'
+    elif getattr(basis, '__ctype_le__', None) is basis:
+        order = '<'
+    else:
+        order = '>'
+    st = struct.Struct(order + code)
+    if st.size != sizeof(basis):
+        return None
+    return st
+    
+def _read_simple(basis, st, handler, addr, size):
+    """
+    Read the simple type basis from the handler at addr, and return its
+    value.  st is _struct_for(basis).
+    """
+    if st is None:
+        return _read_copy(basis, handler, addr, size).value
+        
+    # A handler that can unpack for itself, such as a CachedHandler, can do
+    # it straight out of its own buffers on a hit.
+    unpack = getattr(handler, 'readBytesUnpack', None)
+    if unpack is not None:
+        return unpack(addr, st)[0]
+    return _read_decode(st.unpack_from, handler, addr, size)[0]
+    
+def _decode_simple(basis, st, data):
+    """
+    Return the value of data as the simple type basis.  st is
+    _struct_for(basis).
+    """
+    if st is None:
+        return basis.from_buffer_copy(data).value
+    return st.unpack_from(data)[0]
+    
+def _simple_bytes(basis, st, value):
+    """
+    Return the bytes of value as the simple type basis.  st is
+    _struct_for(basis).
+    """
+    if st is not None:
+        try:
+            return st.pack(value)
+        except (struct.error, OverflowError):
+            # ctypes is more forgiving than struct about things like
+            # out of range integers.  Let it decide.
+            pass
+    return byte_converter(basis(value))
+
+#######################################################################
+# Each of the RemoteX classes gets subclassed for every basis it's used
+# with, so that everything that only depends on the basis is worked out
+# once rather than every time an instance is made.
+#######################################################################
+
+_specialized_classes = {}
+
+def _specialize(cls, basis, attributes):
+    """
+    Return the subclass of cls specialized for basis, creating it if
+    need be.  attributes(basis) returns the dict of class attributes
+    that the specialized subclass should have.
+    """
+    if cls.__dict__.get('_basis') is basis:
+        # Already specialized.
+        return cls
+    key = (cls, basis)
+    try:
+        return _specialized_classes[key]
+    except KeyError:
+        pass
+    d = attributes(basis)
+    d['__slots__'] = ()
+    
+    # The specialized classes are an implementation detail, so they go
+    # by the same name as the class they specialize.
+    d['__qualname__'] = getattr(cls, '__qualname__', cls.__name__)
+    spec = type(cls.__name__, (cls,), d)
+    _specialized_classes[key] = spec
+    return spec
+
+def _cached_dir(obj):
+    """
+    Return dir() for an instance of a specialized RemoteX class, which is
+    everything on the class plus the public field names.  It's only
+    worked out once per class.
+    """
+    cls = obj.__class__
+    names = cls.__dict__.get('_dir_')
+    if names is None:
+        names = tuple(dir(cls)) + cls._public_fields
+        cls._dir_ = names
+    return list(names)
 
 class _Translator(object):
     """
@@ -85,63 +331,62 @@ class _Translator(object):
     Translators will never be directly exposed to the outside world, they're
     a trampoline layer for the various higher level structure types.
     
+    The offset is always absolute, relative to the start of the handler.
+    
     """
     
+    __slots__ = ('basis', 'handler', 'offset', 'size', 'kind', '_remote', '_struct')
+    
     def __init__(self, basis, handler, offset):
         self.basis = basis
         self.handler = handler
         self.offset = offset 
         self.size = sizeof(basis)
+        self.kind = _kind_of(basis)
+        self._remote = None
+        self._struct = _struct_for(basis) if self.kind == _SIMPLE else None
         
-        if issubclass(basis, Bitfield):
-            # This is a Bitfield object.
-            self.remote = RemoteBitfield(basis, self.getSubHandler())
-            self.get = self.getRemote
-            self.set = self.setBitfield
-            
-        elif hasattr(basis, '_fields_'):
-            # This is a Structure.  We'll only move the fields
-            # of this.
-            self.remote = RemoteStruct(basis, self.getSubHandler())
-            self.get = self.getRemote
-            self.set = self.cantSet
-            
-        elif hasattr(basis, '__getitem__'):
-            # This is an array.  We'll only move the elements
-            # of this.
-            self.remote = RemoteArray(basis, self.getSubHandler())
-            self.get = self.getRemote
-            self.set = self.cantSet
-        
-        elif hasattr(basis, 'value'):
-            # This is simple data.  We want to get/set it directly.
-            self.get = self.getSimple
-            self.set = self.setSimple
-            
-        else:
-            # This isn't something we know how to deal with.
-            raise TypeError("Can't translate " + self.basis.__class__.__name__)
+    @property
+    def remote(self):
+        """
+        The RemoteX object for a Bitfield, Structure or array basis.  It
+        isn't made until someone actually asks for it.
+        """
+        if self._remote is None:
+            self._remote = _remote_classes[self.kind](self.basis, self.handler, self.offset)
+        return self._remote
+        
+    def get(self):
+        if self.kind == _SIMPLE:
+            return self.getSimple()
+        return self.remote
         
-    def getSubHandler(self):
-        return _SubHandler(self.handler, self.offset)
+    def set(self, value):
+        kind = self.kind
+        if kind == _SIMPLE:
+            self.setSimple(value)
+        elif kind == _BITFIELD:
+            self.setBitfield(value)
+        else:
+            self.cantSet(value)
         
     def getAll(self):
         """Fetch this object from the handler."""
-        b = self.handler.readBytes(self.offset, self.size)
-        return self.basis.from_buffer_copy(b)
+        return _read_copy(self.basis, self.handler, self.offset, self.size)
         
     def setAll(self, value):
         """Send this object through the handler."""
         self.handler.writeBytes(self.offset, byte_converter(value))
         
+    def setAllRaw(self, raw):
+        """Send the already converted bytes of this object through the handler."""
+        self.handler.writeBytes(self.offset, raw)
+        
     #######################################################################
-    # Some subset of these functions will be mapped onto get/set, based
-    # on what the basis type is.
+    # get and set hand off to one of these, based on what the basis
+    # type is.
     #######################################################################
         
-    def getRemote(self):
-        return self.remote
-        
     def setBitfield(self, value):
         if isinstance(value, self.basis):
             self.remote.base = value.base
@@ -149,13 +394,13 @@ class _Translator(object):
             self.remote.base = value 
     
     def cantSet(self, value):
-        raise TypeError("Can't assign to remote object of type " + self.basis.__class__.__name__)
+        raise TypeError("Can't assign to remote object of type " + self.basis.__name__)
         
     def getSimple(self):
-        return self.getAll().value
+        return _read_simple(self.basis, self._struct, self.handler, self.offset, self.size)
         
     def setSimple(self, value):
-        self.setAll(self.basis(value))
+        self.handler.writeBytes(self.offset, _simple_bytes(self.basis, self._struct, value))
 
 class RemoteStruct(object):
     """
@@ -163,9 +408,10 @@ class RemoteStruct(object):
     
     The initialization syntax is::
     
-        RemoteStruct(basis, handler)
+        RemoteStruct(basis, handler, offset=0)
         
-    Where ``basis`` is a Structure or Union class (not instance).
+    Where ``basis`` is a Structure or Union class (not instance), and
+    ``offset`` is the address of the structure within the handler.
     
     The ``handler`` is any object that has at least the two methods::
     
@@ -174,55 +420,324 @@ class RemoteStruct(object):
         
     ``readBytes`` returns a bytearray of length size.  ``writeBytes``
     accepts anything that supports the buffer protocol (bytes, bytearray,
-    ctypes derived classes, etc).
+    ctypes derived classes, etc).  If the handler also has the method::
+    
+        readBytesInto(self, addr, size, buf, offset=0)
+        
+    then reads go into reusable scratch buffers, rather than needing a
+    new bytearray each time.
+    
+    Reading every field of a RemoteStruct one at a time costs one
+    transaction per field.  The module functions getAll(rs) and
+    setAll(rs, value) move the whole structure in a single transaction
+    instead, and inside a ``with snapshot(rs):`` block field reads are
+    all served from one getAll.  These, and getFields, setFields,
+    setAllRaw and batch, are functions rather than methods so that
+    every field name of the basis stays free.
     
     """
+    __slots__ = ('_handler', '_offset', '_snapshot', '_remotes')
+    
     def _unboundreference_(self):
         return self._basis
+        
+    def __new__(cls, basis, handler, offset=0):
+        cls = _specialize(cls, basis, _struct_attributes)
+        return super(RemoteStruct, cls).__new__(cls)
     
-    def __init__(self, basis, handler):
-        super(RemoteStruct, self).__setattr__('_basis', basis)
-        super(RemoteStruct, self).__setattr__('_fields_', basis._fields_)
+    def __init__(self, basis, handler, offset=0):
         super(RemoteStruct, self).__setattr__('_handler', handler)
+        super(RemoteStruct, self).__setattr__('_offset', offset)
+        super(RemoteStruct, self).__setattr__('_snapshot', None)
         
-        # Somehow, the Structure doesn't allow us to easily
-        # query the types of each of its elements.  Instead,
-        # we'll build up a dict to hit things quickly by
-        # name.
-        fields = {}
-        for f in basis._fields_:
-            key = f[0]
-            cls = f[1]
-            if len(f) > 2:
-                raise ValueError(
-                    "RemoteStruct doesn't support basic Structure bitfields, as "
-                    "their implementation is a bit dodgy.  Please use the Bitfield "
-                    "class instead to implement bit fields."
-                )
-            field = getattr(basis, key)
-            trans = _Translator(cls, handler, field.offset)
-            fields[key] = trans
-            
-        super(RemoteStruct, self).__setattr__('_fields', fields)
+        # The RemoteX objects for the composite fields are only made
+        # when they're first asked for.
+        super(RemoteStruct, self).__setattr__('_remotes', {})
+        
+    def _remote(self, i):
+        """Return the RemoteX object for composite field number i."""
+        try:
+            return self._remotes[i]
+        except KeyError:
+            pass
+        remote = _remote_classes[self._kinds[i]](
+            self._classes[i], self._handler, self._offset + self._offsets[i]
+        )
+        self._remotes[i] = remote
+        return remote
         
     def __getattr__(self, key):
         try:
-            return self._fields[key].get()
-        except KeyError as e:
+            getter = self._getters[key]
+        except KeyError:
             raise AttributeError("No field named " + key)
             
+        snap = self._snapshot
+        if snap is not None:
+            return getattr(snap, key)
+        return getter(self)
+            
     def __setattr__(self, key, value):
         try:
-            self._fields[key].set(value)
-        except KeyError as e:
+            setter = self._setters[key]
+        except KeyError:
             raise AttributeError("No field named " + key)
+        setter(self, value)
 
     def __dir__(self):
         """
         For Python 3.2 compatibility, must return a list rather than
         an iterable.
         """
-        return list(dir(self.__class__)) + [x[0] for x in self._fields_ if not x[0].startswith('_')]
+        return _cached_dir(self)
+
+#######################################################################
+# Whole-structure operations on RemoteStructs.  These are functions
+# rather than methods so that they can't hide any field of the basis,
+# whatever it's called.  Given a RemoteArray or RemoteBitfield instead,
+# those that it has methods for hand off to them.
+#######################################################################
+
+def getAll(remote, *args):
+    """
+    Fetch a local copy of an entire RemoteStruct in one transaction.
+    Anything else is passed on to remote.getAll(*args).
+    """
+    if not isinstance(remote, RemoteStruct):
+        return remote.getAll(*args)
+    return _read_copy(remote._basis, remote._handler, remote._offset, sizeof(remote._basis))
+    
+def setAll(remote, value):
+    """
+    Send an entire structure through the handler in one transaction.
+    Anything other than a RemoteStruct is passed on to remote.setAll.
+    """
+    if not isinstance(remote, RemoteStruct):
+        return remote.setAll(value)
+    remote._handler.writeBytes(remote._offset, byte_converter(value))
+    
+def setAllRaw(remote, raw):
+    """
+    Send the bytes of an entire structure through the handler in one
+    transaction.  raw is anything writeBytes accepts, such as
+    bytes(structure); converting once and calling setAllRaw saves
+    doing the conversion every time the same value is written.
+    Anything other than a RemoteStruct is passed on to remote.setAllRaw.
+    """
+    if not isinstance(remote, RemoteStruct):
+        return remote.setAllRaw(raw)
+    remote._handler.writeBytes(remote._offset, raw)
+    
+def getFields(remote, *names):
+    """
+    Return a list of the values of the named fields of the RemoteStruct
+    remote.  If the handler has a readMany method they're all fetched in
+    one transaction, even though they needn't be next to each other.
+    
+    Fields that are themselves structures, arrays or bitfields come
+    back as local ctypes objects rather than Remote ones.
+    """
+    try:
+        fields = [remote._index[k] for k in names]
+    except KeyError as e:
+        raise AttributeError("No field named " + e.args[0])
+        
+    classes = remote._classes
+    offset = remote._offset
+    requests = [(offset + remote._offsets[i], sizeof(classes[i])) for i in fields]
+    results = []
+    for i, data in zip(fields, _read_many(remote._handler, requests)):
+        local = classes[i].from_buffer_copy(data)
+        results.append(local.value if remote._kinds[i] == _SIMPLE else local)
+    return results
+    
+def setFields(remote, E=None, **F):
+    '''
+    setFields(D, [E, ]**F) -> None
+    Set fields of the RemoteStruct D from dict/iterable E and F, in the
+    same way as the update method of a dict.  If the handler has a
+    writeMany method then all the writes are made in one transaction.
+    
+    Only simple and Bitfield fields can be set.
+    '''
+    updates = []
+    if E:
+        try:
+            updates.extend((k, E[k]) for k in E.keys())
+        except (AttributeError, ValueError):
+            updates.extend(E)
+    updates.extend(F.items())
+    
+    writes = []
+    for k, v in updates:
+        try:
+            i = remote._index[k]
+        except KeyError:
+            raise AttributeError("No field named " + k)
+        cls = remote._classes[i]
+        kind = remote._kinds[i]
+        if kind == _SIMPLE:
+            data = _simple_bytes(cls, _struct_for(cls), v)
+        elif kind == _BITFIELD:
+            if not isinstance(v, cls):
+                v = cls(base = v)
+            data = byte_converter(v)
+        else:
+            raise TypeError("Can't assign to remote object of type " + cls.__name__)
+        writes.append((remote._offset + remote._offsets[i], data))
+    _write_many(remote._handler, writes)
+    
+def snapshot(remote):
+    """
+    Context manager that reads an entire RemoteStruct once, and then
+    serves all field reads from that local copy until the block exits.
+    The local copy is also the value of the with statement.
+    
+    Fields that are themselves structures, arrays or bitfields come
+    back as local ctypes objects rather than Remote ones.  Writes
+    still go straight through the handler, and are not reflected
+    in the snapshot.  Nested snapshots share the outermost one.
+    
+    Given a RemoteBitfield, this is remote.snapshot().
+    """
+    if not isinstance(remote, RemoteStruct):
+        return remote.snapshot()
+    return _struct_snapshot(remote)
+    
+@contextmanager
+def _struct_snapshot(remote):
+    outer = remote._snapshot
+    if outer is None:
+        super(RemoteStruct, remote).__setattr__('_snapshot', getAll(remote))
+    try:
+        yield remote._snapshot
+    finally:
+        super(RemoteStruct, remote).__setattr__('_snapshot', outer)
+        
+def batch(remote):
+    """
+    Context manager that holds back every write made through a
+    RemoteStruct and its fields until the block exits, and then sends
+    them all at once.  Writes to neighbouring or overlapping bytes are
+    joined into one block, and if the handler has a writeMany method
+    the blocks that are left go out in a single transaction.
+    
+    Reads inside the block send the held writes first, so they always
+    see them.  If the block raises, writes not yet sent are dropped.
+    Nested batches are sent on by the outermost one.
+    
+    Given a RemoteArray or RemoteBitfield, this is remote.batch().
+    """
+    if not isinstance(remote, RemoteStruct):
+        return remote.batch()
+    return _struct_batch(remote)
+    
+@contextmanager
+def _struct_batch(remote):
+    handler, remotes = remote._handler, remote._remotes
+    wb = _WriteBatch(handler)
+    super(RemoteStruct, remote).__setattr__('_handler', wb)
+    super(RemoteStruct, remote).__setattr__('_remotes', {})
+    ok = False
+    try:
+        yield remote
+        ok = True
+    finally:
+        super(RemoteStruct, remote).__setattr__('_handler', handler)
+        super(RemoteStruct, remote).__setattr__('_remotes', remotes)
+        wb.close(send = ok)
+
+#######################################################################
+# Templates for the field accessors of specialized RemoteStructs.
+#######################################################################
+
+# Each field of a RemoteStruct gets its own getter and setter function,
+# with the field's class, struct, offset and size written straight into it.
+# _struct_class compiles them all in one go for each basis.
+
+_get_simple_template = """
+def _get_{n}(self):
+    return _read_simple(_cls_{n}, _st_{n}, self._handler, self._offset + {offset}, {size})
+"""
+
+_get_remote_template = """
+def _get_{n}(self):
+    return self._remote({n})
+"""
+
+_set_simple_template = """
+def _set_{n}(self, value):
+    self._handler.writeBytes(self._offset + {offset}, _simple_bytes(_cls_{n}, _st_{n}, value))
+"""
+
+_set_bitfield_template = """
+def _set_{n}(self, value):
+    if isinstance(value, _cls_{n}):
+        value = value.base
+    self._remote({n}).base = value
+"""
+
+_set_cant_template = """
+def _set_{n}(self, value):
+    raise TypeError("Can't assign to remote object of type " + _cls_{n}.__name__)
+"""
+
+def _struct_attributes(basis):
+    """Return the class attributes of a RemoteStruct specialized for basis."""
+    # Somehow, the Structure doesn't allow us to easily
+    # query the types of each of its elements.  Instead,
+    # we'll build up parallel tables of everything we need
+    # to know about each field, and the source for all the
+    # accessors.
+    classes = []
+    offsets = []
+    kinds = []
+    source = []
+    namespace = {
+        '_read_simple' : _read_simple,
+        '_simple_bytes' : _simple_bytes,
+        '__name__' : __name__
+    }
+    for n, f in enumerate(basis._fields_):
+        key = f[0]
+        cls = f[1]
+        if len(f) > 2:
+            raise ValueError(
+                "RemoteStruct doesn't support basic Structure bitfields, as "
+                "their implementation is a bit dodgy.  Please use the Bitfield "
+                "class instead to implement bit fields."
+            )
+        field = getattr(basis, key)
+        kind = _kind_of(cls)
+        classes.append(cls)
+        offsets.append(field.offset)
+        kinds.append(kind)
+        namespace['_cls_{0}'.format(n)] = cls
+        
+        if kind == _SIMPLE:
+            namespace['_st_{0}'.format(n)] = _struct_for(cls)
+            templates = (_get_simple_template, _set_simple_template)
+        elif kind == _BITFIELD:
+            templates = (_get_remote_template, _set_bitfield_template)
+        else:
+            templates = (_get_remote_template, _set_cant_template)
+        for t in templates:
+            source.append(t.format(n = n, offset = field.offset, size = field.size))
+            
+    exec(''.join(source), namespace)
+    
+    names = [f[0] for f in basis._fields_]
+    return {
+        '_basis' : basis,
+        '_fields_' : basis._fields_,
+        '_classes' : tuple(classes),
+        '_offsets' : tuple(offsets),
+        '_kinds' : tuple(kinds),
+        '_index' : dict((k, n) for n, k in enumerate(names)),
+        '_public_fields' : tuple(k for k in names if not k.startswith('_')),
+        '_getters' : dict((k, namespace['_get_{0}'.format(n)]) for n, k in enumerate(names)),
+        '_setters' : dict((k, namespace['_set_{0}'.format(n)]) for n, k in enumerate(names))
+    }
 
 class RemoteArray(object):
     """
@@ -230,55 +745,120 @@ class RemoteArray(object):
     
     The initialization syntax is::
     
-        RemoteStruct(basis, handler)
+        RemoteArray(basis, handler, offset=0)
         
     Where ``basis`` is any array of ctypes classes such as a c_uint * 8.
     """
+    __slots__ = ('_handler', '_offset', '_translators')
+    
     def _unboundreference_(self):
         return self._basis
     
-    def __init__(self, basis, handler):
-        self._basis = basis
+    def __new__(cls, basis, handler, offset=0):
+        cls = _specialize(cls, basis, _array_attributes)
+        return super(RemoteArray, cls).__new__(cls)
+        
+    def __init__(self, basis, handler, offset=0):
         self._handler = handler
+        self._offset = offset
         
-        self._basetype = basetype = basis._type_
-        self._elementsize = sizeof(basetype)
-        self._count = sizeof(basis) // sizeof(basetype)
+        # Simple elements are read and written directly, and never
+        # need translators.  Composite ones get a translator made the
+        # first time each element is touched, and kept from then on.
+        self._translators = None if self._simple else [None] * self._count
         
-    @lru_cache(maxsize = 64)
     def _getTranslator(self, idx):
         """
-        We'll create the translators dynamically as needed for
-        this class.  This is probably woefully inefficient, but
-        we'll try to fix that later.
+        We'll create the translators for composite elements
+        dynamically as needed for this class.  idx must
+        already be in range.
         """
-        if idx >= self._count:
-            raise IndexError('Index {0} be less than {1}'.format(idx, self._count))
-        offset = self._elementsize * idx
-        return _Translator(self._basetype, self._handler, offset)
+        trans = self._translators[idx]
+        if trans is None:
+            offset = self._offset + self._elementsize * idx
+            trans = _Translator(self._basetype, self._handler, offset)
+            self._translators[idx] = trans
+        return trans
+        
+    def _getSimple(self, idx):
+        """Read simple element idx straight from the handler."""
+        es = self._elementsize
+        return _read_simple(self._basetype, self._struct, self._handler, self._offset + es * idx, es)
+        
+    def _indices(self, idx):
+        """
+        Return an iterable of the appropriate indices, whether
+        idx is a positive int, negative int, or slice.
+        """
+        count = self._count
+        if isinstance(idx, slice):
+            return range(*idx.indices(count))
+            
+        # If this is negative, flip it.
+        n = idx + count if idx < 0 else idx
+        if not 0 <= n < count:
+            raise IndexError('Index {0} out of range for {1} elements'.format(idx, count))
+        return (n,)
         
     def _idx_translator(self, idx):
         """
-        Return an iterator over the translators for the
-        appropriate indices, whether idx is a positive
-        int, negative int, or slice.
+        Return a list of the translators for the appropriate
+        indices, whether idx is a positive int, negative int,
+        or slice.
         """
-        try:
-            start, stop, step = idx.indices(len(self))
-            return (self._getTranslator(n) for n in range(start, stop, step))
-        except AttributeError:
-            # If this is negative, flip it.
-            if idx < 0:
-                idx = len(self) - idx
-            return [self._getTranslator(idx)]
+        return [self._getTranslator(n) for n in self._indices(idx)]
             
+    def _contiguous(self, idx):
+        """
+        If idx is a slice of simple data that can be moved as a single
+        block, return the (start, stop) indices of that block.  Otherwise
+        return None.
+        """
+        if self._simple and isinstance(idx, slice):
+            start, stop, step = idx.indices(self._count)
+            if step == 1:
+                return start, max(start, stop)
+        return None
+        
     def __getitem__(self, idx):
         """
         Return a single value for a single index, or a list for a
         slice index.  Negative indices are dealt with in the usual
         Pythonic way.
+        
+        Contiguous slices of simple data are read in a single
+        transaction, and other slices of simple data in a single
+        readMany if the handler has one.
         """
-        results = [t.get() for t in self._idx_translator(idx)]
+        block = self._contiguous(idx)
+        if block is not None:
+            start, stop = block
+            n = stop - start
+            results = []
+            if n:
+                es = self._elementsize
+                # list() rather than [:], which would give c_char and
+                # c_wchar arrays back as a single string.
+                results = list(_read_copy(
+                    self._basetype * n, self._handler, self._offset + start * es, n * es
+                ))
+                if isinstance(results[0], simple_basetype):
+                    # Subclasses of the simple types don't get turned
+                    # into Python values automatically.
+                    results = [r.value for r in results]
+        elif self._simple:
+            indices = self._indices(idx)
+            if isinstance(idx, slice):
+                es = self._elementsize
+                requests = [(self._offset + es * n, es) for n in indices]
+                results = [
+                    _decode_simple(self._basetype, self._struct, data)
+                    for data in _read_many(self._handler, requests)
+                ]
+            else:
+                results = [self._getSimple(n) for n in indices]
+        else:
+            results = [t.get() for t in self._idx_translator(idx)]
         if len(results) == 1:
             return results[0]
         else:
@@ -289,38 +869,208 @@ class RemoteArray(object):
         Set a single value for a single index, or a list for a
         slice index.  Negative indices are dealt with in the usual
         Pythonic way.
+        
+        Contiguous slices of simple data are written in a single
+        transaction, and other slices of simple data in a single
+        writeMany if the handler has one.
         """
         try:
             valiter = iter(value)
         except TypeError:
             valiter = [value]
             
-        for t, v in zip(self._idx_translator(idx), valiter):
-            t.set(v)
+        block = self._contiguous(idx)
+        if block is not None:
+            start, stop = block
+            values = list(valiter)[:stop - start]
+            if values:
+                data = (self._basetype * len(values))(*values)
+                self._handler.writeBytes(
+                    self._offset + start * self._elementsize, byte_converter(data)
+                )
+            return
+            
+        if self._simple:
+            es = self._elementsize
+            _write_many(self._handler, [
+                (self._offset + es * n, _simple_bytes(self._basetype, self._struct, v))
+                for n, v in zip(self._indices(idx), valiter)
+            ])
+        else:
+            for t, v in zip(self._idx_translator(idx), valiter):
+                t.set(v)
     
     def __len__(self):
         return self._count
         
+    def getAll(self, out=None):
+        """
+        Fetch the entire array in one transaction.
+        
+        With no arguments, returns a local copy as an instance of the
+        basis.  Otherwise out is any writable buffer of at least the size
+        of the array, such as an instance of the basis, a bytearray or a
+        numpy array, and the data is read straight into it and out is
+        returned.  Either way the result can be wrapped by something like
+        numpy.frombuffer without any further copying.
+        """
+        size = self._count * self._elementsize
+        if out is None:
+            return _read_copy(self._basis, self._handler, self._offset, size)
+            
+        try:
+            view = memoryview(out).cast('B')
+        except AttributeError:
+            # No memoryview.cast in Python 2; out had better be bytes.
+            view = out
+        readinto = getattr(self._handler, 'readBytesInto', None)
+        if readinto is None:
+            view[:size] = self._handler.readBytes(self._offset, size)
+        else:
+            readinto(self._offset, size, view)
+        return out
+        
+    def setAll(self, value):
+        """Send an entire array through the handler in one transaction."""
+        self._handler.writeBytes(self._offset, byte_converter(value))
+
+    @contextmanager
+    def batch(self):
+        """
+        Context manager that holds back every write made through this
+        array and its elements until the block exits, and then sends
+        them all at once.  Writes to neighbouring or overlapping bytes
+        are joined into one block, so filling in the elements one
+        after another takes as few writes as the gaps between them allow.
+
+        Reads inside the block send the held writes first, so they
+        always see them.  If the block raises, writes not yet sent are
+        dropped.  Nested batches are sent on by the outermost one.
+        """
+        handler, translators = self._handler, self._translators
+        batch = _WriteBatch(handler)
+        self._handler = batch
+        if translators is not None:
+            self._translators = [None] * self._count
+        ok = False
+        try:
+            yield self
+            ok = True
+        finally:
+            self._handler = handler
+            self._translators = translators
+            batch.close(send = ok)
+
+def _array_attributes(basis):
+    """Return the class attributes of a RemoteArray specialized for basis."""
+    basetype = basis._type_
+    
+    # Arrays of simple data can move whole slices in a single
+    # transaction, rather than one per element.
+    simple = _kind_of(basetype) == _SIMPLE
+    return {
+        '_basis' : basis,
+        '_basetype' : basetype,
+        '_elementsize' : sizeof(basetype),
+        '_count' : sizeof(basis) // sizeof(basetype),
+        '_simple' : simple,
+        '_struct' : _struct_for(basetype) if simple else None
+    }
+        
 class RemoteBitfield(object):
+    __slots__ = ('_handler', '_offset', '_underlying', '_snapshot_depth', '_batch_depth')
+    
     def _unboundreference_(self):
         return self._basis
         
-    def __init__(self, basis, handler):
-        super(RemoteBitfield, self).__setattr__('_basis', basis)
-        super(RemoteBitfield, self).__setattr__('_size', sizeof(basis))
+    def __new__(cls, basis, handler, offset=0):
+        cls = _specialize(cls, basis, _bitfield_attributes)
+        return super(RemoteBitfield, cls).__new__(cls)
+        
+    def __init__(self, basis, handler, offset=0):
         super(RemoteBitfield, self).__setattr__('_handler', handler)
+        super(RemoteBitfield, self).__setattr__('_offset', offset)
         super(RemoteBitfield, self).__setattr__('_underlying', basis())
+        super(RemoteBitfield, self).__setattr__('_snapshot_depth', 0)
+        super(RemoteBitfield, self).__setattr__('_batch_depth', 0)
         
     def _update_underlying(self):
-        new_basis = self._basis.from_buffer_copy(self._handler.readBytes(0, self._size))
+        if self._snapshot_depth:
+            # Pinned by snapshot(), don't go back to the handler.
+            return
+        new_basis = _read_copy(self._basis, self._handler, self._offset, self._size)
         super(RemoteBitfield, self).__setattr__('_underlying', new_basis)
         
     def _transmit_underlying(self):
-        self._handler.writeBytes(0, byte_converter(self._underlying))
+        if self._batch_depth:
+            # Held by batch(), which will write it out at the end.
+            return
+        self._handler.writeBytes(self._offset, byte_converter(self._underlying))
+        
+    def setAllRaw(self, raw):
+        """
+        Send the bytes of the entire bitfield through the handler.  raw
+        is anything writeBytes accepts, such as bytes(bitfield);
+        converting once and calling setAllRaw saves doing the conversion
+        every time the same value is written.  The bitfield is written
+        as given, even inside a snapshot, and the snapshot isn't changed.
+        """
+        self._handler.writeBytes(self._offset, raw)
+        
+    @contextmanager
+    def snapshot(self):
+        """
+        Context manager that reads the bitfield once, and then serves
+        every field read from that copy until the block exits, rather
+        than going back to the handler for each one.  The local copy is
+        also the value of the with statement.
+        
+        Writes still go through the handler, but an update inside the
+        block starts from the snapshot rather than a fresh read.  Nested
+        snapshots share the outermost one.
+        """
+        if not self._snapshot_depth:
+            self._update_underlying()
+        super(RemoteBitfield, self).__setattr__('_snapshot_depth', self._snapshot_depth + 1)
+        try:
+            yield self._underlying
+        finally:
+            super(RemoteBitfield, self).__setattr__('_snapshot_depth', self._snapshot_depth - 1)
+            
+    @contextmanager
+    def batch(self):
+        """
+        Context manager that works like snapshot(), but also holds back
+        every field write until the block exits.  However many fields are
+        read and written inside it, the register sees one read and at
+        most one write, and no write at all if nothing changed.  If the
+        block raises, the held writes are dropped.  Nested batches are
+        written out by the outermost one.
+        """
+        with self.snapshot() as local:
+            before = byte_converter(local)
+            super(RemoteBitfield, self).__setattr__('_batch_depth', self._batch_depth + 1)
+            try:
+                yield local
+            finally:
+                super(RemoteBitfield, self).__setattr__('_batch_depth', self._batch_depth - 1)
+            if not self._batch_depth and byte_converter(local) != before:
+                self._transmit_underlying()
         
     def __getattr__(self, key):
-        self._update_underlying()
-        return getattr(self._underlying, key)
+        layout = self._fieldlayout.get(key)
+        if layout is None or self._rawstruct is None or self._snapshot_depth:
+            self._update_underlying()
+            return getattr(self._underlying, key)
+            
+        # A single field can be sliced straight out of the raw register
+        # value, without making a ctypes object to get it from.
+        shift, mask, signed = layout
+        raw = _read_simple(None, self._rawstruct, self._handler, self._offset, self._size)
+        v = (raw >> shift) & mask
+        if signed and v > (mask >> 1):
+            v -= mask + 1
+        return v
         
     def __setattr__(self, key, value):
         """Set one field."""
@@ -337,18 +1087,18 @@ class RemoteBitfield(object):
 
     def __iter__(self):
         """Return an iterator over the field names."""
-        return iter(self._underlying)
+        return iter(self._public_fields)
         
     def keys(self):
         """Return a list of the field names."""
-        return list(iter(self))
+        return list(self._public_fields)
 
     def __dir__(self):
         """
         For Python 3.2 compatibility, must return a list rather than
         an iterable.
         """
-        return list(dir(self.__class__)) + list(self.keys())
+        return _cached_dir(self)
 
     def clone(self):
         """Return a new bitfield with the same value.
@@ -366,12 +1116,11 @@ class RemoteBitfield(object):
     def items(self):
         """
         Returns an iterator over the named bitfields in the structure as
-        2-tuples of (key, value).  Uses a clone so as to only read from
-        the underlying data once.
+        2-tuples of (key, value).  The underlying data is only read once.
         
         """
-        temp = self.clone()
-        return [(f, getattr(temp, f)) for f in iter(self)]
+        self._update_underlying()
+        return self._underlying.items()
         
     def update(self, E=None, **F):
         '''
@@ -385,10 +1134,26 @@ class RemoteBitfield(object):
         in case the target is a memory-mapped register.  The read and write
         are independent, rather than an atomic RMW cycle.
         
+        If the update doesn't actually change anything then the write is
+        skipped.  Use forceupdate for registers where the write itself has
+        side effects.
+        
         '''
+        self._update(E, F, False)
         
+    def forceupdate(self, E=None, **F):
+        """
+        D.forceupdate([E, ]**F) -> None
+        The same as update, except that the write is always made, even if
+        nothing changed.
+        """
+        self._update(E, F, True)
+        
+    def _update(self, E, F, force):
+        """update and forceupdate, with force saying which."""
         self._update_underlying()
         temp = self._underlying
+        before = byte_converter(temp)
         
         if E:
             try:
@@ -401,7 +1166,8 @@ class RemoteBitfield(object):
         for k, v in F.items():
             setattr(temp, k, v)
             
-        self._transmit_underlying()
+        if force or byte_converter(temp) != before:
+            self._transmit_underlying()
         
     def __repr__(self):
         """Provide a good looking view for interactive use."""
@@ -410,6 +1176,27 @@ class RemoteBitfield(object):
             ', '.join("{0}={1}".format(k, v) for k, v in self.items())
         )
 
+_remote_classes = {
+    _BITFIELD : RemoteBitfield,
+    _STRUCT : RemoteStruct,
+    _ARRAY : RemoteArray
+}
+
+# The struct codes for the raw little-endian register value of a Bitfield,
+# by size.
+_raw_codes = {1 : '<B', 2 : '<H', 4 : '<I', 8 : '<Q'}
+
+def _bitfield_attributes(basis):
+    """Return the class attributes of a RemoteBitfield specialized for basis."""
+    code = _raw_codes.get(sizeof(basis))
+    return {
+        '_basis' : basis,
+        '_size' : sizeof(basis),
+        '_public_fields' : tuple(basis._fieldnames_),
+        '_fieldlayout' : basis._fieldlayout_,
+        '_rawstruct' : None if code is None else struct.Struct(code)
+    }
+
 def Remote(basis, handler):
     """
     Return the appropriate type of RemoteX to support the
@@ -417,9 +1204,8 @@ def Remote(basis, handler):
     etc.
     """
     try:
-        trans = _Translator(basis, handler, 0)
-        return trans.remote 
-    except (TypeError, AttributeError):
+        return _remote_classes[_kind_of(basis)](basis, handler)
+    except (TypeError, AttributeError, KeyError):
         raise TypeError("Can't make a remote object from " + repr(basis))
 
 class FakeHandler(object):
@@ -432,7 +1218,8 @@ class FakeHandler(object):
     data member.
     
     As a protocol handler for a RemoteStruct, it also support the 
-    writeBytes and readBytes methods.
+    writeBytes, readBytes, readBytesInto, readMany and writeMany methods.
+    readMany and writeMany just loop, and count each block separately.
     
     For diagnostic purposes, the FakeHandler also provides
     the reads, writes, bytesRead, and bytesWritten data
@@ -443,6 +1230,13 @@ class FakeHandler(object):
         self.target = target
         byte_overlay = c_uint8 * sizeof(self.target)
         self._view = byte_overlay.from_buffer(self.target)
+        try:
+            # Slicing a ctypes array builds a list of ints; slicing a
+            # memoryview is a straight copy of the bytes.
+            self._view = memoryview(self._view).cast('B')
+        except AttributeError:
+            # No memoryview.cast in Python 2, stay with the ctypes array.
+            pass
         
         self.clearstats()
         
@@ -463,7 +1257,22 @@ class FakeHandler(object):
         
         end = addr + size
         return bytearray(self._view[addr:end])
+        
+    def readBytesInto(self, addr, size, buf, offset=0):
+        self._log.info('Read %d bytes from 0x%X', size, addr)
+        self.reads += 1
+        self.bytesRead += size
+        
+        end = addr + size
+        buf[offset:offset+size] = self._view[addr:end]
 
+    def readMany(self, requests):
+        return [self.readBytes(addr, size) for addr, size in requests]
+        
+    def writeMany(self, writes):
+        for addr, data in writes:
+            self.writeBytes(addr, data)
+            
     def clearstats(self):
         self.reads = 0
         self.writes = 0
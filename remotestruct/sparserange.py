@@ -11,6 +11,7 @@ is inclusive on the low end, and exlusive on the high end.
 from __future__ import print_function
 from warnings import warn
 from bisect import bisect_left, bisect_right
+from itertools import chain, starmap
 
 try:
 	# Python 3.3 and later
@@ -26,6 +27,11 @@ try:
 	basestring
 except NameError:
 	basestring = str
+	
+try:
+	_range = xrange
+except NameError:
+	_range = range
 
 #######################################################################
 # A couple of convenience functions will help keep the code sensible.
@@ -38,6 +44,74 @@ def even(x):
 def odd(x):
 	"""True if x is odd."""
 	return (x & 1)
+	
+# Truth tables for _merge, indexed by (in a) + 2*(in b).
+_OR		= (False, True, True, True)
+_AND	= (False, False, False, True)
+_SUB	= (False, True, False, False)
+_XOR	= (False, True, True, False)
+
+# Merging walks every boundary of both lists in Python, whereas adding or
+# removing one pair at a time does a binary search and a C level splice
+# per pair.  When one list is this many times shorter than the other,
+# going pair by pair wins.
+_MERGE_RATIO = 8
+
+def _merge(a, b, table):
+	"""Combine two _ranges lists a and b into a new one, in a single
+	linear pass over both.  Whether a value is in the result is given by
+	table[(value in a) + 2*(value in b)].
+	
+	>>> _merge([10, 20, 30, 40], [15, 35], _OR)
+	[10, 40]
+	>>> _merge([10, 20, 30, 40], [15, 35], _AND)
+	[15, 20, 30, 35]
+	>>> _merge([10, 20, 30, 40], [15, 35], _SUB)
+	[10, 15, 35, 40]
+	>>> _merge([10, 20, 30, 40], [20, 30], _XOR)
+	[10, 40]
+	"""
+	out = []
+	i = j = 0
+	na = len(a)
+	nb = len(b)
+	inside = False
+	while i < na or j < nb:
+		# Take the next boundary from either list, or both if they're equal.
+		if j == nb or (i < na and a[i] <= b[j]):
+			x = a[i]
+		else:
+			x = b[j]
+		if i < na and a[i] == x:
+			i += 1
+		if j < nb and b[j] == x:
+			j += 1
+			
+		# Same trick as everywhere else, we're inside a list's ranges
+		# when its index is odd.
+		now = table[(i & 1) | ((j & 1) << 1)]
+		if now != inside:
+			out.append(x)
+			inside = now
+	return out
+
+def _collapse(values):
+	"""Sort an iterable of numbers into a _ranges list, with runs of
+	consecutive values gathered up into single ranges.
+	
+	>>> _collapse([12, 5, 3, 4, 10, 4, 11])
+	[3, 6, 10, 13]
+	"""
+	out = []
+	for x in sorted(values):
+		# Sorted means x + 1 can never fall short of the current stop, so
+		# anything touching the last range just extends it.
+		if out and x <= out[-1]:
+			out[-1] = x + 1
+		else:
+			out.append(x)
+			out.append(x + 1)
+	return out
 
 #######################################################################
 # Define our classes
@@ -120,21 +194,31 @@ class SparseRange(MutableSet):
 		self._ranges = []
 		if args:
 			if len(args) == 1 and isinstance(args[0], basestring):
-				# Cook down the string.
+				# Cook down the string.  Terms are usually written in order, so
+				# anything that starts past the end of what we have so far can
+				# just be tacked on; only the rest need a real _addrange.
+				r = self._ranges
 				for term in args[0].split(','):
 					parts = term.split('-')
 					if len(parts) == 1:
-						self.add(int(parts[0]))
+						start = int(parts[0])
+						stop = start + 1
 					elif len(parts) == 2:
-						self.addrange(int(parts[0]), int(parts[1]))
+						start, stop = int(parts[0]), int(parts[1])
 					else:
 						raise ValueError("Bad string section: " + term)
+					if start < stop and (not r or start > r[-1]):
+						r.append(start)
+						r.append(stop)
+					else:
+						self._addrange(start, stop)
 				
 			else:
 				self.addrange(*args)
 			
 	def __len__(self):
-		return sum(stop - start for start, stop in self.pairs())
+		r = self._ranges
+		return sum(r[1::2]) - sum(r[0::2])
 		
 	def __bool__(self):
 		"""Test whether the SparseRange is null (len(self) == 0)."""
@@ -152,7 +236,7 @@ class SparseRange(MutableSet):
 			else:
 				return str(start) + '-' + str(stop)
 				
-		return ', '.join(transform_range(*p) for p in self.pairs())
+		return ', '.join(starmap(transform_range, self.pairs()))
 		
 	def __repr__(self):
 		if not self._ranges:
@@ -206,6 +290,22 @@ class SparseRange(MutableSet):
 			
 		return start, stop
 		
+	@staticmethod
+	def _simple_range(rng):
+		"""Return a (start, stop) pair as for _validate_simple_range, or None
+		if rng isn't a simple range.
+		
+		Most things that aren't simple ranges don't have a step at all, and
+		checking for that first saves raising and catching an AttributeError
+		for every plain iterable.
+		"""
+		if not hasattr(rng, 'step'):
+			return None
+		try:
+			return SparseRange._validate_simple_range(rng)
+		except AttributeError:
+			return None
+		
 	#######################################################################
 	# Methods for determining whether we contain a value
 	#######################################################################
@@ -219,6 +319,15 @@ class SparseRange(MutableSet):
 		except _ATE:
 			return False
 	
+	def contains_many(self, values):
+		"""Test whether we contain each of an iterable of numbers, returning
+		a list of bools in the same order.
+		
+		>>> SparseRange('0-10,20-30').contains_many([5, 15, 25, 31, 'x'])
+		[True, False, True, False, False]
+		"""
+		return list(map(self.__contains__, values))
+	
 	def _contains_pair(self, start, stop):
 		"""Test whether we contain all of a contiguous range."""
 		
@@ -242,23 +351,29 @@ class SparseRange(MutableSet):
 		False
 		>>> SparseRange(10, 20).isdisjoint(range(0, 100))
 		False
+		>>> SparseRange(10, 20).isdisjoint(range(15, 15))
+		True
 		"""
 		
-		# Try val as a SparseRange
-		try:
-			return not any(self._intersect_against(*p) for p in val.pairs())
-		except AttributeError:
-			pass
+		# Try val as a SparseRange.  Checking a few pairs one at a time can
+		# stop early; past that a single merge is cheaper.  If either side is
+		# contiguous, it's just one pair against the other.
+		ranges = getattr(val, '_ranges', None)
+		if ranges is not None:
+			if len(self._ranges) == 2:
+				return not val._intersect_against(*self._ranges)
+			if len(ranges) * _MERGE_RATIO <= len(self._ranges):
+				return not any(starmap(self._intersect_against, val.pairs()))
+			return not _merge(self._ranges, ranges, _AND)
 			
 		# Try val as a simple range
-		try:
-			start, stop = self._validate_simple_range(val)
+		pair = self._simple_range(val)
+		if pair is not None:
+			start, stop = pair
 			return not self._intersect_against(start, stop)
-		except AttributeError:
-			pass
 			
 		# Fall back to treating val as an iterable
-		return not any(x in self for x in val)
+		return not any(map(self.__contains__, val))
 		
 	def issubset(self, val):
 		"""Test whether every element in self is in val, i.e.
@@ -269,19 +384,29 @@ class SparseRange(MutableSet):
 		True
 		>>> x.issubset(SparseRange(0,25))
 		False
+		>>> SparseRange().issubset(range(0, 0))
+		True
 		"""
-		# Try val as a SparseRange
-		try:	
-			return all(val._contains_pair(*p) for p in self.pairs())
-		except AttributeError:
-			pass
+		# The null range is a subset of anything.
+		r = self._ranges
+		if not r:
+			return True
+		
+		# Try val as a SparseRange.  If val doesn't even span self there's no
+		# need to look any closer.
+		ranges = getattr(val, '_ranges', None)
+		if ranges is not None:
+			if not ranges or r[0] < ranges[0] or r[-1] > ranges[-1]:
+				return False
+			if len(ranges) == 2:
+				return True
+			return all(starmap(val._contains_pair, self.pairs()))
 			
 		# Try val as a simple range
-		try:
-			start, stop = self._validate_simple_range(val)
-			return (start <= self.min()) and (self.max() < stop)
-		except AttributeError:
-			pass
+		pair = self._simple_range(val)
+		if pair is not None:
+			start, stop = pair
+			return (start <= r[0]) and (r[-1] <= stop)
 			
 		# Fall back to treating val as an iterable
 		return all(x in val for x in self)
@@ -297,22 +422,31 @@ class SparseRange(MutableSet):
 		True
 		>>> x.issuperset(range(5,25))
 		False
+		>>> x.issuperset(range(15,15))
+		True
 		"""
-		# Try val as a SparseRange
-		try:	
-			return all(self._contains_pair(*p) for p in val.pairs())
-		except AttributeError:
-			pass
+		# Try val as a SparseRange, with a shortcut for a contiguous one.
+		ranges = getattr(val, '_ranges', None)
+		if ranges is not None:
+			if not ranges:
+				return True
+			r = self._ranges
+			if not r or ranges[0] < r[0] or ranges[-1] > r[-1]:
+				return False
+			if len(r) == 2:
+				return True
+			if len(ranges) == 2:
+				return self._contains_pair(*ranges)
+			return all(starmap(self._contains_pair, val.pairs()))
 			
 		# Try val as a simple range
-		try:
-			start, stop = self._validate_simple_range(val)
-			return self._contains_pair(start, stop)
-		except AttributeError:
-			pass
+		pair = self._simple_range(val)
+		if pair is not None:
+			start, stop = pair
+			return stop <= start or self._contains_pair(start, stop)
 			
 		# Fall back to treating val as an iterable
-		return all(x in self for x in val)
+		return all(map(self.__contains__, val))
 		
 	def __le__(self, val):
 		try:
@@ -340,26 +474,26 @@ class SparseRange(MutableSet):
 		False
 		>>> x == 5
 		False
+		>>> SparseRange() == range(3, 3)
+		True
 		"""
 		
 		# Try val as a SparseRange
-		try:
-			return self._ranges == val._ranges
-		except AttributeError:
-			pass
+		ranges = getattr(val, '_ranges', None)
+		if ranges is not None:
+			return self._ranges == ranges
 			
 		# Try val as a simple range
-		try:
-			start, stop = self._validate_simple_range(val)
-			return self._ranges == [start, stop]
-		except AttributeError:
-			pass
+		pair = self._simple_range(val)
+		if pair is not None:
+			start, stop = pair
+			return self._ranges == ([start, stop] if start < stop else [])
 			
 		# Try val as an iterable.
 		try:
 			if len(val) != len(self):
 				return False
-			return all(x in self for x in val)
+			return all(map(self.__contains__, val))
 		except _ATE:
 			return NotImplemented
 			
@@ -450,9 +584,12 @@ class SparseRange(MutableSet):
 		# bisect_left is our friend here, because if the value already exists
 		# then the returned index is that value.
 	
-		# First, we need to find where our new value goes in _ranges.
-		left = bisect_left(self._ranges, start)
-		right = bisect_left(self._ranges, stop)
+		# First, we need to find where our new value goes in _ranges.  Since
+		# start < stop, right can't be left of left, so that much of the list
+		# needn't be searched again.
+		r = self._ranges
+		left = bisect_left(r, start)
+		right = bisect_left(r, stop, left)
 	
 		# Thought exercise cases.  Here are what we'll get for left, right given
 		# a few different possibilities of start, stop, and the desired _ranges
@@ -477,36 +614,22 @@ class SparseRange(MutableSet):
 		#	(20, 35)	=> (1, 3)		=> [10, 40, 50, 60]					1:3 = []
 		#	(55, 65)	=> (5, 6)		=> [10, 20, 30, 40, 50, 65]			5:6 = [65]
 		
-		set_value = [True, True]
-		
-		if odd(left):
-			# If left is an odd number, then the start is either inside a range,
-			# or is equal to the existing stop point of a range.  In either
-			# case, there's no reason to replace any value with start.
-			set_value[0] = False
-		else:
-			# If left is an even number, then the start is either outside a
-			# range or on the existing start point of a range.
-			pass
-			
-		if odd(right):
-			# If right is an odd number then the stop point is either inside a
-			# range or the existing stop point of a range.  In either case,
-			# there's no reason to replace any value with stop.
-			set_value[1] = False 
-		else:
-			# If right is an even number, then the stop is either outside a
-			# range or on the existing start point of a range.
-			try:
-				if self._ranges[right] == stop:
-					right += 1
-					set_value[1] = False 
-			except IndexError:
-				# We're extending the last range; that's fine.
-				pass
-		
-		self._ranges[left:right] = [v for v, c in zip((start, stop), set_value) if c]
-		assert even(len(self._ranges)), 'Wound up with odd number in _ranges.'
+		# The parity of left and right says everything.  An odd left means
+		# that start is either inside a range or on the existing stop point of
+		# one, so there's no reason to write start; an even left means start
+		# is outside a range or on its start point, and it goes in.  The same
+		# holds for right and stop, except that a stop landing exactly on the
+		# start point of the next range merges the two, which is the same as
+		# moving right onto the odd index past it.
+		# An even right may also be off the end of _ranges, in which case
+		# we're extending the last range; that's fine.
+		if even(right) and right < len(r) and r[right] == stop:
+			right += 1
+		
+		# Slicing (start, stop) from 0 or 1 to 1 or 2 picks out exactly the
+		# values to keep.
+		r[left:right] = (start, stop)[(left & 1):(2 - (right & 1))]
+		assert even(len(r)), 'Wound up with odd number in _ranges.'
 
 	def _add_SparseRange(self, rng):
 		"""Add (union) a SparseRange to self.
@@ -516,12 +639,13 @@ class SparseRange(MutableSet):
 		# We can optimize this if we're currently empty.
 		if not self._ranges:
 			self._ranges = list(rng._ranges)
-		else:
-			# OPTIMIZE: There's probably a faster algorithm here.  This operates
-			# in O(n_rng * log n(self)) time because of all the searches, there
-			# should be a way to do it in O(n_rng + n_self)
+		elif len(rng._ranges) == 2:
+			self._addrange(*rng._ranges)
+		elif len(rng._ranges) * _MERGE_RATIO <= len(self._ranges):
 			for start, stop in rng.pairs():
 				self._addrange(start, stop)
+		else:
+			self._ranges = _merge(self._ranges, rng._ranges, _OR)
 				
 	def _add_rangetype(self, rng):
 		"""Add (union) a range to self.
@@ -539,8 +663,9 @@ class SparseRange(MutableSet):
 			
 	def _add_iterable(self, iterable):
 		"""Add (union) an iterable to self."""
-		for x in iterable:
-			self.add(x)
+		rng = self.__class__()
+		rng._ranges = _collapse(iterable)
+		self._add_SparseRange(rng)
 			
 	#######################################################################
 	# Internal methods for removing from the range.
@@ -567,9 +692,12 @@ class SparseRange(MutableSet):
 		# bisect_left is our friend here, because if the value already exists
 		# then the returned index is that value.
 	
-		# First, we need to find where our new value goes in _ranges.
-		left = bisect_left(self._ranges, start)
-		right = bisect_left(self._ranges, stop)
+		# First, we need to find where our new value goes in _ranges.  Since
+		# start < stop, right can't be left of left, so that much of the list
+		# needn't be searched again.
+		r = self._ranges
+		left = bisect_left(r, start)
+		right = bisect_left(r, stop, left)
 	
 		# Thought exercise cases.  Here are what we'll get for left, right given
 		# a few different possibilities of start, stop, and the desired _ranges
@@ -595,56 +723,35 @@ class SparseRange(MutableSet):
 		#	(20, 40)	=> (1, 3)		=> [10, 20, 50, 60]					2:4 = []
 		#	(55, 65)	=> (5, 6)		=> [10, 20, 30, 40, 50, 55]			5:6 = [55]
 		
-		set_value = [True, True]
-		
-		if odd(left):
-			# If left is an odd number, then the start is either inside a range,
-			# or is equal to the existing stop point of a range.
-			try:
-				if self._ranges[left] == start:
-					left += 1
-					set_value[0] = False
-			except IndexError:
-				# We're past the last range; there's just nothing to do.
-				return
-			
-		else:
-			# If left is an even number, then the start is either outside a
-			# range or on the existing start point of a range.  Either way,
-			# there's no reason to be adding it into the ranges.
-			set_value[0] = False
-			
-		if odd(right):
-			# If right is an odd number then the stop point is either inside a
-			# range or the existing stop point of a range.
-			try:
-				if self._ranges[right] == stop:
-					right += 1
-					set_value[1] = False 
-			except IndexError:
-				# We're past the last range; that's fine.
-				pass
-				
-		else:
-			# If right is an even number, then the stop is either outside a
-			# range or on the existing start point of a range.  In either case,
-			# we won't be writing it into the ranges.
-			set_value[1] = False 
-		
-		self._ranges[left:right] = [v for v, c in zip((start, stop), set_value) if c]
-		assert even(len(self._ranges)), 'Wound up with odd number in _ranges.'
+		# This is the mirror image of _addrange.  An even left means that
+		# start is outside a range or on its start point, so there's nothing
+		# to cut there; an odd left means start is inside a range and becomes
+		# its new stop point, unless it's already exactly that stop point, in
+		# which case left moves on to the even index past it.  Likewise for
+		# right and stop.  Odd indices are always inside _ranges, so there's
+		# no need to worry about running off the end.
+		if odd(left) and r[left] == start:
+			left += 1
+		if odd(right) and r[right] == stop:
+			right += 1
+		
+		r[left:right] = (start, stop)[(1 - (left & 1)):(1 + (right & 1))]
+		assert even(len(r)), 'Wound up with odd number in _ranges.'
 
 	def _del_SparseRange(self, rng):
 		"""Remove a SparseRange from self.
 		Raise AttributeError if rng is not a SparseRange.
 		"""
+		ranges = rng._ranges
 		if not self._ranges:
 			return
-		for start, stop in rng.pairs():
-			# OPTIMIZE: There's probably a faster algorithm here.  This operates
-			# in O(n_rng * log n(self)) time because of all the searches, there
-			# should be a way to do it in O(n_rng + n_self)
-			self._delrange(start, stop)
+		elif len(ranges) == 2:
+			self._delrange(*ranges)
+		elif len(ranges) * _MERGE_RATIO <= len(self._ranges):
+			for start, stop in rng.pairs():
+				self._delrange(start, stop)
+		else:
+			self._ranges = _merge(self._ranges, ranges, _SUB)
 				
 	def _del_rangetype(self, rng):
 		"""Remove a range from self.
@@ -662,8 +769,9 @@ class SparseRange(MutableSet):
 				
 	def _del_iterable(self, iterable):
 		"""Remove an iterable from self."""
-		for x in iterable:
-			self.discard(x)
+		rng = self.__class__()
+		rng._ranges = _collapse(iterable)
+		self._del_SparseRange(rng)
 
 	#######################################################################
 	# Iterator methods
@@ -684,7 +792,7 @@ class SparseRange(MutableSet):
 		>>> list(SparseRange('10-20,30-33,55').subranges())
 		[SparseRange(10, 20), SparseRange(30, 33), SparseRange(55, 56)]
 		"""
-		return (self.__class__(start, stop) for start, stop in self.pairs())
+		return starmap(self.__class__, self.pairs())
 			
 	def __iter__(self):
 		"""Return an iterator over all integer values contained.
@@ -692,7 +800,7 @@ class SparseRange(MutableSet):
 		>>> list(SparseRange('1-10,20,21'))
 		[1, 2, 3, 4, 5, 6, 7, 8, 9, 20, 21]
 		"""
-		return (x for rng in self.pairs() for x in range(*rng))
+		return chain.from_iterable(starmap(range, self.pairs()))
 			
 	#######################################################################
 	# External methods for adding to the range
@@ -721,6 +829,15 @@ class SparseRange(MutableSet):
 		"""Append val to the range.
 		val can be a SparseRange, a range, or an iterable.
 		"""
+		# Check for the common types directly, and only go hunting by trial
+		# and error for anything else.
+		if isinstance(val, SparseRange):
+			self._add_SparseRange(val)
+			return self
+		if isinstance(val, _range):
+			self._add_rangetype(val)
+			return self
+			
 		for fn in (self._add_SparseRange, self._add_rangetype, self._add_iterable):
 			try:
 				fn(val)
@@ -784,6 +901,13 @@ class SparseRange(MutableSet):
 		>>> x
 		SparseRange('0-5, 7, 9')
 		"""
+		if isinstance(val, SparseRange):
+			self._del_SparseRange(val)
+			return self
+		if isinstance(val, _range):
+			self._del_rangetype(val)
+			return self
+			
 		for fn in (self._del_SparseRange, self._del_rangetype, self._del_iterable):
 			try:
 				fn(val)
@@ -816,8 +940,9 @@ class SparseRange(MutableSet):
 		if even(right):
 			right -= 1
 		
-		# Extract the correct range indices
-		if left > right:
+		# Extract the correct range indices.  An empty (start, stop) would
+		# otherwise come back as a zero-length range.
+		if left > right or stop <= start:
 			return []
 		
 		ranges = self._ranges[left:right+1]
@@ -835,23 +960,25 @@ class SparseRange(MutableSet):
 		val can be a SmartRange, a range, or an iterable.
 		"""
 		
-		# Try val as a SparseRange.
+		# Try val as a SparseRange, with a shortcut for a contiguous one.
 		nsa = self.__class__()
 		
-		try:
-			gen = (self._intersect_against(*p) for p in val.pairs())
-			nsa._ranges = sum(gen, [])
+		ranges = getattr(val, '_ranges', None)
+		if ranges is not None:
+			if len(ranges) == 2:
+				nsa._ranges = self._intersect_against(*ranges)
+			elif len(self._ranges) == 2:
+				nsa._ranges = val._intersect_against(*self._ranges)
+			else:
+				nsa._ranges = _merge(self._ranges, ranges, _AND)
 			return nsa
-		except AttributeError:
-			pass
 			
 		# Try val as a simple range.
-		try:
-			start, stop = self._validate_simple_range(val)
+		pair = self._simple_range(val)
+		if pair is not None:
+			start, stop = pair
 			nsa._ranges = self._intersect_against(start, stop)
 			return nsa
-		except AttributeError:
-			pass
 			
 		# Try val as an iterable.
 		try:
@@ -864,7 +991,44 @@ class SparseRange(MutableSet):
 		"""Create a new SparseRange with all values in only self or val but not both.
 		val can be a SparseRange, a range, or an iterable.
 		"""
-		return (self | val) - (self & val)
+		ranges = getattr(val, '_ranges', None)
+		if ranges is None:
+			return (self | val) - (self & val)
+			
+		nsa = self.__class__()
+		nsa._ranges = _merge(self._ranges, ranges, _XOR)
+		return nsa
+		
+	# MutableSet would otherwise supply &= and ^= by discarding or adding
+	# one element at a time.
+	
+	def __iand__(self, val):
+		"""Keep only the values that are also in val.
+		
+		>>> x = SparseRange('0-10,20-30')
+		>>> x &= range(5, 25)
+		>>> x
+		SparseRange('5-10, 20-25')
+		"""
+		nsa = self.__and__(val)
+		if nsa is NotImplemented:
+			return nsa
+		self._ranges = nsa._ranges
+		return self
+		
+	def __ixor__(self, val):
+		"""Keep the values in only self or val but not both.
+		
+		>>> x = SparseRange('0-10')
+		>>> x ^= SparseRange('5-15')
+		>>> x
+		SparseRange('0-5, 10-15')
+		"""
+		nsa = self.__xor__(val)
+		if nsa is NotImplemented:
+			return nsa
+		self._ranges = nsa._ranges
+		return self
 
 	def split(self, spliton):
 		"""
@@ -879,6 +1043,8 @@ class SparseRange(MutableSet):
 		[SparseRange(10, 20), SparseRange(), SparseRange(30, 35), SparseRange('35-40, 50-60'), SparseRange()]
 		>>> list(x.split([]))
 		[SparseRange('10-20, 30-40, 50-60')]
+		>>> list(x.split([40, 15]))
+		[SparseRange('10-20, 30-40'), SparseRange(), SparseRange(50, 60)]
 		"""
 		
 		try:
@@ -886,11 +1052,24 @@ class SparseRange(MutableSet):
 		except TypeError:
 			it = [spliton]
 		
-		right = self.copy()
-		lastpoint = self.min()
+		# Each piece is cut straight out of self, from the highest split
+		# point seen so far up to the next one, rather than whittling a copy
+		# of self down and re-merging it for every point.
+		r = self._ranges
+		if not r:
+			for point in it:
+				yield self.__class__()
+			yield self.__class__()
+			return
+			
+		lastpoint = r[0]
 		for point in it:
-			left = right & range(lastpoint, point)
-			right -= left
+			left = self.__class__()
+			if point > lastpoint:
+				left._ranges = self._intersect_against(lastpoint, point)
+				lastpoint = point
 			yield left
 			
+		right = self.__class__()
+		right._ranges = self._intersect_against(lastpoint, r[-1])
 		yield right
@@ -170,5 +170,28 @@ class MethodTester(unittest.TestCase):
 		self.assertTrue(self.flags.en1)
 		self.assertEqual(self.flags.val, 41)
 		
+		self.flags.update([('en0', True), ('val', 0x1FF)], _dummy16 = 0xFFFF)
+		self.assertEqual(self.flags.base, 0xFFFFFF11)
+		
+		x = BF_SHORT()
+		x.update({'lsn' : -2, 'msb' : True})
+		self.assertEqual(x.base, 0x800E)
+		self.assertEqual(x.lsn, -2)
+		
+		# base goes in first, with the fields on top of it, and names
+		# that aren't fields are ignored.
+		self.flags.update(bob = 1, val = 0x5A, base = 0x1234)
+		self.assertEqual(self.flags.base, 0x5A34)
+		x.update({'base' : 0x8001})
+		self.assertEqual(x.base, 0x8001)
+		
+	def testMemoized(self):
+		"""The same definition should give back the same class."""
+		fields = [('mantissa', c_uint, 23), ('exponent', c_uint, 8), ('sign', c_uint, 1)]
+		doc = 'Bitfields of an IEEE754 single precision float.'
+		self.assertIs(make_bf('BF_IEEE754', iter(fields), c_float, doc), BF_IEEE754)
+		self.assertIsNot(make_bf('BF_IEEE754', fields, c_float), BF_IEEE754)
+		self.assertIsNot(make_bf('BF_IEEE754', fields, c_uint32, doc), BF_IEEE754)
+		
 if __name__ == '__main__':
 	unittest.main()
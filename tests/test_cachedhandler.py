@@ -6,14 +6,16 @@ Rob Gaddi, Highland Technology
 """
 
 from random import Random
+from binascii import unhexlify
 from remotestruct import Remote, FakeHandler, CachedHandler
 from bitfield import *
 import unittest
 from time import time, sleep
+from struct import Struct
 
 # Let's create a basic package of 4KB of source data just once.
 rnd = Random(0)
-sourcedata = bytearray(rnd.randint(0, 255) for _ in range(4096))
+sourcedata = bytearray(unhexlify('%08192x' % rnd.getrandbits(4096 * 8)))
 
 # And give it some structure.
 Data = (c_uint32 * 1024)
@@ -65,8 +67,9 @@ class CacheTest(unittest.TestCase):
 	
 	def test_random(self):
 		"""Confirm random access to the data always yields correct results."""
+		check, randrange, n = self.assertReadData, rnd.randrange, len(self.basis)
 		for _ in range(1000):
-			self.assertReadData(rnd.randrange(0, len(self.basis)))
+			check(randrange(0, n))
 	
 	def test_prefetch(self):
 		"""Confirm the cache is prefetching correctly."""
@@ -79,8 +82,9 @@ class CacheTest(unittest.TestCase):
 	
 		# Now run the line backwards through all the data that should have been
 		# cached.  None of this should require new fetches.
+		check = self.assertReadData
 		for addr in range(self.sets * self.linewords - 1, -1, -1):
-			self.assertReadData(addr)
+			check(addr)
 			
 		# Each read should have been a cache hit, so no real transactions should
 		# have occured.
@@ -106,6 +110,177 @@ class CacheTest(unittest.TestCase):
 		self.assertReadData(self.linewords-1)
 		self.assertCacheStats(2, self.sets-1)
 		
+	def test_coalesce(self):
+		"""Confirm that adjacent missed lines are read in one transaction."""
+		
+		linebytes = self.linewords * 4
+		self.cachehandler.max_coalesce_lines = self.sets >> 1
+		data = self.cachehandler.readBytes(linebytes >> 1, self.sets * linebytes)
+		self.assertEqual(data, sourcedata[linebytes >> 1:(self.sets * linebytes) + (linebytes >> 1)])
+		
+		# That touched one more line than we have sets, which should have
+		# taken three reads to fill.
+		self.assertCacheStats(0, self.sets+1)
+		self.assertHandlerStats(reads=3, bytesRead=(self.sets+1) * linebytes)
+		
+	def test_readahead(self):
+		"""Confirm that reading through in order fetches lines ahead."""
+		
+		self.cachehandler.readahead = 2
+		for addr in range(8 * self.linewords):
+			self.assertReadData(addr)
+			
+		# Line 0 is read by itself.  The miss on line 1 shows the data
+		# being read in order, so it brings in lines 2 and 3 as well,
+		# then lines 4 to 6 and 7 to 9 come in together.
+		self.assertHandlerStats(reads=4, bytesRead=10 * self.linewords * 4)
+		self.assertCacheStats(8 * self.linewords - 4, 4)
+		
+		# Reading ahead turns itself off once the reads stop being in order.
+		self.realhandler.clearstats()
+		self.assertReadData(16 * self.linewords)
+		self.assertReadData(18 * self.linewords)
+		self.assertHandlerStats(reads=2, bytesRead=2 * self.linewords * 4)
+		
+	def test_readahead_limit(self):
+		"""Confirm reading ahead stops at the end of the target."""
+		
+		small = (c_uint8 * 32)(*range(32))
+		handler = CachedHandler(FakeHandler(small), linebytes=8)
+		handler.readahead = 2
+		handler.readahead_limit = 32
+		handler.max_coalesce_lines = 1
+		self.assertEqual(handler.readBytes(16, 16), bytearray(range(16, 32)))
+		self.assertEqual(handler.handler.bytesRead, 16)
+		
+		# Up to the limit, lines are still read ahead.
+		handler.invalidate()
+		handler.handler.clearstats()
+		self.assertEqual(handler.readBytes(0, 16), bytearray(range(16)))
+		self.assertEqual(handler.readBytes(16, 8), bytearray(range(16, 24)))
+		self.assertEqual(handler.handler.bytesRead, 32)
+		self.assertEqual(handler.handler.reads, 2)
+		
+	def test_readinto(self):
+		"""Confirm readBytesInto puts the data in the right place."""
+		
+		linebytes = self.linewords * 4
+		buf = bytearray(3 * linebytes)
+		self.cachehandler.readBytesInto(linebytes >> 1, 2 * linebytes, buf, 4)
+		self.assertEqual(buf[:4], bytearray(4))
+		self.assertEqual(buf[4:4 + 2*linebytes], sourcedata[linebytes >> 1:(linebytes >> 1) + 2*linebytes])
+		self.assertEqual(buf[4 + 2*linebytes:], bytearray(linebytes - 4))
+		
+	def test_hit_after_misses(self):
+		"""Confirm a hit after a run of misses isn't lost when they're filled."""
+		
+		# Filling the run of misses takes over every line in the cache,
+		# including the one that was hit.
+		linebytes = self.linewords * 4
+		self.cachehandler.readBytes(self.sets * linebytes, 4)
+		data = self.cachehandler.readBytes(0, (self.sets+1) * linebytes)
+		self.assertEqual(data, sourcedata[:(self.sets+1) * linebytes])
+		
+		# And the same again through the nocache/noprefetch path.
+		self.cachehandler.invalidate()
+		nocache = (self.sets+1) * linebytes
+		self.cachehandler.nocache.addrange(nocache, nocache+4)
+		self.cachehandler.readBytes(self.sets * linebytes, 4)
+		data = self.cachehandler.readBytes(0, (self.sets+2) * linebytes)
+		self.assertEqual(data, sourcedata[:(self.sets+2) * linebytes])
+		
+	def test_nocache(self):
+		"""Confirm that addresses on nocache are always read fresh."""
+		
+		self.cachehandler.nocache.addrange(4, 8)
+		self.assertEqual(self.cachehandler.readBytes(0, 12), sourcedata[:12])
+		
+		# Change the data behind the cache's back.  Only the nocache
+		# word should see the change.
+		self.basis[0] = self.basis[1] = self.basis[2] = 0
+		data = self.cachehandler.readBytes(0, 12)
+		self.assertEqual(data[:4], sourcedata[:4])
+		self.assertEqual(data[4:8], bytearray(4))
+		self.assertEqual(data[8:], sourcedata[8:12])
+		self.assertEqual(self.cachehandler.readBytes(4, 4), bytearray(4))
+		self.assertHandlerStats(reads=3)
+		
+	def test_noprefetch(self):
+		"""Confirm that addresses on noprefetch are only read when asked for."""
+		
+		linebytes = self.linewords * 4
+		self.cachehandler.noprefetch.addrange(4, 8)
+		self.cachehandler.nocache |= self.cachehandler.noprefetch
+		
+		# The line gets read around the noprefetch word, taking only the
+		# side of it that was asked for.
+		self.assertReadData(0)
+		self.assertHandlerStats(reads=1, bytesRead=4)
+		self.assertReadData(3)
+		self.assertHandlerStats(reads=2, bytesRead=linebytes-4)
+		self.assertReadData(2)
+		self.assertHandlerStats(reads=2)
+		
+		# Asking for it by name reads it, and only it.
+		self.assertReadData(1)
+		self.assertHandlerStats(reads=3, bytesRead=linebytes)
+		
+		# A longer read takes everything but the one word from the cache.
+		self.assertEqual(self.cachehandler.readBytes(0, 2*linebytes), sourcedata[:2*linebytes])
+		self.assertHandlerStats(reads=5, bytesRead=3*linebytes)
+		
+	def test_short_target(self):
+		"""Confirm a target that ends partway through a line still works."""
+		
+		BF_SHORT = make_bf('BF_SHORT', [('a', c_uint, 4), ('b', c_uint, 12)], c_uint16)
+		handler = CachedHandler(FakeHandler(BF_SHORT(a = 3, b = 0x123)))
+		uut = Remote(BF_SHORT, handler)
+		self.assertEqual((uut.a, uut.b), (3, 0x123))
+		
+		small = (c_uint16 * 3)(1, 2, 3)
+		handler = CachedHandler(FakeHandler(small), linebytes=4)
+		uut = Remote(c_uint16 * 3, handler)
+		self.assertEqual(uut[0:3], [1, 2, 3])
+		self.assertEqual(uut[2], 3)
+		
+		# Both lines came in with one read, the second only partly.
+		self.assertEqual(handler.stats(), (1, 2, 0))
+		self.assertEqual(handler.handler.reads, 1)
+		
+	def test_unpack(self):
+		"""Confirm readBytesUnpack works through the cache."""
+		
+		st = Struct('<HI')
+		for addr in (2, 4 * self.linewords - 6, 4 * self.linewords - 4, 2):
+			self.assertEqual(
+				self.cachehandler.readBytesUnpack(addr, st),
+				st.unpack_from(sourcedata, addr)
+			)
+			
+		# The third read crosses into the next line.
+		self.assertCacheStats(3, 2)
+		
+	def test_executor(self):
+		"""Confirm that separate runs of misses can be read on an executor."""
+		try:
+			from concurrent.futures import ThreadPoolExecutor
+		except ImportError:
+			self.skipTest('concurrent.futures not available')
+		
+		# Read every other line so that the runs of misses are broken up.
+		linebytes = self.linewords * 4
+		for line in range(1, 4, 2):
+			self.assertReadData(line * self.linewords)
+		self.cachehandler.clearstats()
+		self.realhandler.clearstats()
+		
+		with ThreadPoolExecutor(2) as executor:
+			self.cachehandler.executor = executor
+			data = self.cachehandler.readBytes(0, 5 * linebytes)
+		self.assertEqual(data, sourcedata[:5 * linebytes])
+		self.assertCacheStats(2, 3)
+		self.assertHandlerStats(reads=3)
+		
 	def test_writes(self):
 		"""Confirm that writes post immediately and are reflected in the cache."""
 		
@@ -117,6 +292,33 @@ class CacheTest(unittest.TestCase):
 		self.assertReadData(addr)
 		self.assertCacheStats(1, 1)
 		
+	def test_longwrites(self):
+		"""Confirm that writes crossing cache lines land in the right place."""
+		
+		linebytes = self.linewords * 4
+		self.fillCache()
+		data = bytearray(range(2*linebytes))
+		self.cachehandler.writeBytes(linebytes >> 1, data)
+		self.assertHandlerStats(writes=1, bytesWritten=len(data))
+		self.assertEqual(bytearray(self.basis)[linebytes >> 1:(linebytes >> 1) + len(data)], data)
+		for addr in range(3 * self.linewords):
+			self.assertReadData(addr)
+		
+	def test_nocaching(self):
+		"""Confirm that a timeout of 0 turns off the cache."""
+		
+		self.cachehandler.timeout = 0
+		self.fillCache()
+		self.fillCache()
+		self.assertCacheStats(0, 2 * self.sets)
+		self.assertHandlerStats(reads=2 * self.sets)
+		
+		# And turning it back on again works too.
+		self.cachehandler.timeout = None
+		self.fillCache()
+		self.fillCache()
+		self.assertCacheStats(self.sets, 3 * self.sets)
+		
 	def test_timeout(self):
 		"""Make sure that the timeouts work."""
 		
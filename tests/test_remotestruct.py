@@ -39,16 +39,23 @@ class FakeCalTable(Structure):
 	]
 		
 class RemoteStructTest(unittest.TestCase):
-	def setUp(self):
-		self.basis = FakeCalTable(
+	@classmethod
+	def setUpClass(cls):
+		# Build everything once, and have setUp put the data back.
+		cls.template = FakeCalTable(
 			serial = 1234,
 			dash = 1
 		)
-		self.handler = remotestruct.FakeHandler(self.basis)
-		self.uut = remotestruct.Remote(
+		cls.basis = FakeCalTable()
+		cls.handler = remotestruct.FakeHandler(cls.basis)
+		cls.uut = remotestruct.Remote(
 			basis = FakeCalTable,
-			handler = self.handler
+			handler = cls.handler
 		)
+		
+	def setUp(self):
+		memmove(addressof(self.basis), addressof(self.template), sizeof(FakeCalTable))
+		self.handler.clearstats()
 	
 	def test_simple(self):
 		"""Try the simple data field accesses."""
@@ -75,9 +82,54 @@ class RemoteStructTest(unittest.TestCase):
 			elem.offset = n
 			elem.slope = n
 			
-		for n, elem in enumerate(self.basis.chans):
-			self.assertEqual(n, elem.offset)
-			self.assertAlmostEqual(n, elem.slope)
+		self.assertEqual(
+			[(elem.offset, elem.slope) for elem in self.basis.chans],
+			[(n, n) for n in range(16)]
+		)
+		
+	def test_array_batch(self):
+		"""Writes inside a batch should be joined wherever they touch."""
+		
+		with self.uut.chans.batch() as chans:
+			for n, elem in enumerate(chans):
+				elem.offset = n
+				elem.slope = n
+			self.assertEqual(self.handler.writes, 0)
+		self.assertEqual(
+			[(elem.offset, elem.slope) for elem in self.basis.chans],
+			[(n, n) for n in range(16)]
+		)
+		self.assertEqual(self.handler.writes, 16)
+		self.assertEqual(self.handler.bytesWritten, 16*8)
+		
+		basis = (c_uint32 * 8)()
+		handler = remotestruct.FakeHandler(basis)
+		uut = remotestruct.Remote(c_uint32 * 8, handler)
+		with uut.batch():
+			for n in range(7, -1, -1):
+				uut[n] = n
+			uut[2:4] = [20, 30]
+			uut[3] = 31
+			self.assertEqual(uut[3], 31)
+			uut[7] = 70
+		self.assertEqual(list(basis), [0, 1, 20, 31, 4, 5, 6, 70])
+		self.assertEqual(handler.writes, 2)
+		
+	def test_batch_raises(self):
+		"""A batch that raises drops its writes, but leaves things working."""
+		
+		with self.assertRaises(ValueError):
+			with remotestruct.batch(self.uut):
+				c6 = self.uut.chans[6]
+				c6.offset = 17
+				raise ValueError()
+		self.assertEqual(self.basis.chans[6].offset, 0)
+		self.assertEqual(self.handler.writes, 0)
+		
+		# Remotes from inside the batch write straight through now.
+		c6.offset = 42
+		self.assertEqual(self.basis.chans[6].offset, 42)
+		self.assertEqual(self.handler.writes, 1)
 		
 	def test_bitfield(self):
 		"""Try the bitfield members in chan."""
@@ -108,6 +160,80 @@ class RemoteStructTest(unittest.TestCase):
 		self.assertEqual(self.handler.bytesRead, 4)
 		self.assertEqual(self.handler.bytesWritten, 4)
 		
+	def test_bitfield_unchanged(self):
+		"""Updates that don't change anything shouldn't write, unless forced."""
+		
+		flags = self.uut.chans[1].flags
+		flags.update(en0 = False, val = 0)
+		flags.en1 = 0
+		self.assertEqual(self.handler.reads, 2)
+		self.assertEqual(self.handler.writes, 0)
+		
+		flags.forceupdate(en0 = False)
+		self.assertEqual(self.handler.writes, 1)
+		
+		# update has no arguments of its own to get in the way of fields.
+		BF_FORCE = make_bf('BF_FORCE', [('force', c_uint, 4), ('E', c_uint, 4)], c_uint8)
+		basis = BF_FORCE()
+		uut = remotestruct.Remote(BF_FORCE, remotestruct.FakeHandler(basis))
+		uut.update(force = 3)
+		self.assertEqual(basis.force, 3)
+		
+	def test_bitfield_snapshot(self):
+		"""Field reads inside a snapshot should only read the register once."""
+		
+		self.basis.chans[4].flags.val = 0x5A
+		flags = self.uut.chans[4].flags
+		with flags.snapshot():
+			self.assertEqual(flags.val, 0x5A)
+			self.assertEqual(flags.en0, 0)
+			self.assertEqual(dict(flags.items())['val'], 0x5A)
+		self.assertEqual(self.handler.reads, 1)
+		
+		self.assertEqual(flags.en1, 0)
+		self.assertEqual(self.handler.reads, 2)
+		
+	def test_bitfield_batch(self):
+		"""A batch should read once and write once, however many fields change."""
+		
+		flags = self.uut.chans[4].flags
+		with flags.batch():
+			flags.en0 = 1
+			flags.en1 = 1
+			flags.val = flags.val + 0x12
+			self.assertEqual(self.handler.writes, 0)
+			self.assertEqual(self.basis.chans[4].flags.en0, 0)
+		self.assertEqual(self.handler.reads, 1)
+		self.assertEqual(self.handler.writes, 1)
+		self.assertEqual(self.basis.chans[4].flags.items(), [('en0', 1), ('en1', 1), ('val', 0x12)])
+		
+		# Nothing changed, nothing written.
+		with flags.batch():
+			flags.en0 = 1
+		self.assertEqual(self.handler.writes, 1)
+		
+	def test_bitfield_signed(self):
+		"""Signed fields should read back the same remotely as locally."""
+		
+		BF_SIGNED = make_bf('BF_SIGNED', fields = [
+				('lsn', c_int, 4),
+				('span', c_uint, 8),
+				('msn', c_int, 4)
+			], basetype = c_uint16
+		)
+		basis = BF_SIGNED(lsn = -3, span = 0x81, msn = 7)
+		uut = remotestruct.Remote(BF_SIGNED, remotestruct.FakeHandler(basis))
+		self.assertEqual((uut.lsn, uut.span, uut.msn), (-3, 0x81, 7))
+		self.assertEqual(uut.base, basis.base)
+		
+	def test_names(self):
+		"""Remote objects should go by the names of their classes."""
+		
+		flags = self.uut.chans[0].flags
+		self.assertEqual(type(self.uut).__name__, 'RemoteStruct')
+		self.assertEqual(type(self.uut.chans).__name__, 'RemoteArray')
+		self.assertEqual(repr(flags), 'RemoteBitfield(en0=0, en1=0, val=0)')
+		
 	def test_bitfield_keys(self):
 		"""Make sure the keys method words."""
 		self.assertEqual(self.uut.chans[2].flags.keys(), ['en0', 'en1', 'val'])
@@ -123,6 +249,23 @@ class RemoteStructTest(unittest.TestCase):
 		with self.assertRaises(AttributeError):
 			self.uut.bob = 0
 			
+	def test_method_names(self):
+		"""Fields named like the whole-structure functions still work."""
+		
+		class Clash(Structure):
+			_fields_ = [('batch', c_uint32), ('snapshot', c_uint32), ('getAll', c_uint32)]
+		basis = Clash(batch = 1, snapshot = 2, getAll = 3)
+		uut = remotestruct.Remote(Clash, remotestruct.FakeHandler(basis))
+		self.assertEqual((uut.batch, uut.snapshot, uut.getAll), (1, 2, 3))
+		uut.batch = 10
+		self.assertEqual(basis.batch, 10)
+		
+		with remotestruct.batch(uut):
+			uut.batch = 11
+			uut.getAll = 13
+		self.assertEqual((basis.batch, basis.getAll), (11, 13))
+		self.assertEqual(remotestruct.getAll(uut).snapshot, 2)
+		
 	def test_bitfield_failures(self):
 		"""
 		Make sure that the RemoteStruct asserts AttributeError on
@@ -134,6 +277,119 @@ class RemoteStructTest(unittest.TestCase):
 		
 		with self.assertRaises(AttributeError):
 			dummy = bf.bob
+			
+	def test_array_slice(self):
+		"""Contiguous slices of simple data should take one transaction."""
+		
+		basis = (c_uint32 * 8)(*range(8))
+		handler = remotestruct.FakeHandler(basis)
+		uut = remotestruct.Remote(c_uint32 * 8, handler)
+		
+		self.assertEqual(uut[2:6], [2, 3, 4, 5])
+		self.assertEqual(handler.reads, 1)
+		self.assertEqual(handler.bytesRead, 16)
+		
+		uut[4:] = [40, 50, 60, 70]
+		self.assertEqual(list(basis), [0, 1, 2, 3, 40, 50, 60, 70])
+		self.assertEqual(handler.writes, 1)
+		
+		self.assertEqual(uut[-1], 70)
+		self.assertEqual(uut[-8], 0)
+		with self.assertRaises(IndexError) as cm:
+			uut[-9]
+		self.assertIn('Index -9 ', str(cm.exception))
+		with self.assertRaises(IndexError):
+			uut[8] = 0
+		handler.clearstats()
+		
+		# Whole array reads take a single transaction too.
+		self.assertEqual(list(uut.getAll()), list(basis))
+		out = (c_uint32 * 8)()
+		self.assertIs(uut.getAll(out), out)
+		self.assertEqual(list(out), list(basis))
+		self.assertEqual(handler.reads, 2)
+		handler.clearstats()
+		
+		# Strided slices still go an element at a time.
+		self.assertEqual(uut[::2], [0, 2, 40, 60])
+		self.assertEqual(handler.reads, 4)
+		
+		# Either way, character arrays come back a character at a time.
+		basis = (c_char * 4)(b'a', b'b', b'c', b'd')
+		uut = remotestruct.Remote(c_char * 4, remotestruct.FakeHandler(basis))
+		self.assertEqual(uut[0:3], [b'a', b'b', b'c'])
+		self.assertEqual(uut[::2], [b'a', b'c'])
+		self.assertEqual(uut[1:2], b'b')
+		
+	def test_simple_types(self):
+		"""Simple fields should round trip just the way ctypes would."""
+		
+		class Mixed(Structure):
+			_fields_ = [
+				('small', c_uint8),
+				('big', c_uint32.__ctype_be__),
+				('real', c_float),
+				('char', c_char),
+				('long', c_long)
+			]
+		basis = Mixed()
+		uut = remotestruct.Remote(Mixed, remotestruct.FakeHandler(basis))
+		
+		uut.small = 0x1FF
+		uut.big = 0x12345678
+		uut.real = 1.5
+		uut.char = b'x'
+		uut.long = -7
+		self.assertEqual(basis.small, 0xFF)
+		self.assertEqual(basis.big, 0x12345678)
+		self.assertEqual(bytearray(basis)[4:8], bytearray(b'\x12\x34\x56\x78'))
+		self.assertEqual(
+			(uut.small, uut.big, uut.real, uut.char, uut.long),
+			(0xFF, 0x12345678, 1.5, b'x', -7)
+		)
+		
+	def test_struct_fields(self):
+		"""getFields and setFields should handle scattered fields."""
+		
+		c2 = self.uut.chans[2]
+		remotestruct.setFields(c2, offset = -3, slope = 0.5, flags = 0x101)
+		self.assertEqual(self.basis.chans[2].offset, -3)
+		self.assertEqual(self.basis.chans[2].slope, 0.5)
+		self.assertEqual(self.basis.chans[2].flags.base, 0x101)
+		
+		offset, flags, slope = remotestruct.getFields(c2, 'offset', 'flags', 'slope')
+		self.assertEqual((offset, flags.val, slope), (-3, 1, 0.5))
+		
+		with self.assertRaises(AttributeError):
+			remotestruct.getFields(c2, 'offset', 'bob')
+		with self.assertRaises(TypeError):
+			remotestruct.setFields(self.uut, chans = 0)
+		
+	def test_struct_snapshot(self):
+		"""getAll and snapshot should read the whole structure at once."""
+		
+		c3 = self.uut.chans[3]
+		c3.offset = -5
+		self.handler.clearstats()
+		
+		with remotestruct.snapshot(c3) as local:
+			self.assertEqual(c3.offset, -5)
+			self.assertEqual(c3.flags.base, 0)
+			self.assertEqual(local.offset, -5)
+		self.assertEqual(self.handler.reads, 1)
+		self.assertEqual(self.handler.bytesRead, sizeof(SubStructure))
+		
+		copy = remotestruct.getAll(self.uut)
+		copy.serial = 4321
+		remotestruct.setAll(self.uut, copy)
+		self.assertEqual(self.basis.serial, 4321)
+		self.assertEqual(self.basis.chans[3].offset, -5)
+		self.assertEqual(self.handler.writes, 1)
+		
+		raw = bytearray(BF_FLAGS(base = 0x2201))
+		for n in range(3):
+			self.uut.chans[n].flags.setAllRaw(raw)
+			self.assertEqual(self.basis.chans[n].flags.base, 0x2201)
 	
 		
 if __name__ == '__main__':
@@ -0,0 +1,228 @@
+"""
+Unit tests for the remotestruct SparseRange library.
+"""
+
+from random import Random
+from remotestruct.sparserange import SparseRange
+import unittest
+import warnings
+
+class SparseRangeTest(unittest.TestCase):
+	def assertMatches(self, sr, values):
+		"""Confirm sr holds exactly values, and is well formed."""
+		r = sr._ranges
+		self.assertEqual(len(r) % 2, 0, r)
+		self.assertTrue(all(a < b for a, b in zip(r, r[1:])), r)
+		self.assertEqual(set(sr), set(values))
+		self.assertEqual(len(sr), len(set(values)))
+	
+	def randomRange(self, rnd, limit=100):
+		"""A random SparseRange, and the set of values it should hold."""
+		sr = SparseRange()
+		values = set()
+		for _ in range(rnd.randint(0, 5)):
+			start = rnd.randrange(limit)
+			stop = start + rnd.randint(1, 20)
+			sr.addrange(start, stop)
+			values.update(range(start, stop))
+		return sr, values
+	
+	def test_operators(self):
+		"""Confirm | & - ^ against SparseRanges, ranges and lists."""
+		
+		x = SparseRange('0-10, 20-30, 40')
+		xs = set(x)
+		operands = (
+			SparseRange('5-25, 40-50'),
+			SparseRange(8, 22),
+			SparseRange(),
+			range(5, 25),
+			range(3, 3),
+			[1, 2, 3, 15, 40, 41, 100],
+			[],
+		)
+		for other in operands:
+			os = set(other)
+			self.assertMatches(x | other, xs | os)
+			self.assertMatches(x & other, xs & os)
+			self.assertMatches(x - other, xs - os)
+			self.assertMatches(x ^ other, xs ^ os)
+		
+		# And none of that should have changed x.
+		self.assertMatches(x, xs)
+	
+	def test_inplace(self):
+		"""Confirm |= &= -= ^= change the range in place."""
+		
+		operands = (
+			SparseRange('5-25, 40-50'),
+			SparseRange(8, 22),
+			SparseRange(),
+			range(5, 25),
+			range(3, 3),
+			[1, 2, 3, 15, 40, 41, 100],
+			[],
+		)
+		for other in operands:
+			os = set(other)
+			for op, expected in (
+				('__ior__', set.__or__),
+				('__iand__', set.__and__),
+				('__isub__', set.__sub__),
+				('__ixor__', set.__xor__),
+			):
+				x = SparseRange('0-10, 20-30, 40')
+				xs = set(x)
+				result = getattr(x, op)(other)
+				self.assertIs(result, x, op)
+				self.assertMatches(x, expected(xs, os))
+		
+		x = SparseRange('0-10')
+		x &= range(5, 25)
+		self.assertEqual(x, range(5, 10))
+		x ^= [9, 10]
+		self.assertEqual(x, [5, 6, 7, 8, 10])
+		x -= SparseRange(6, 8)
+		self.assertEqual(x, [5, 8, 10])
+		x |= range(6, 8)
+		self.assertEqual(x, [5, 6, 7, 8, 10])
+	
+	def test_comparisons(self):
+		"""Confirm isdisjoint, issubset and issuperset against SparseRanges,
+		ranges and lists."""
+		
+		x = SparseRange('0-10, 20-30')
+		cases = (
+			(SparseRange(10, 20), True, False, False),
+			(SparseRange('5-8, 25'), False, False, True),
+			(SparseRange(0, 30), False, True, False),
+			(SparseRange('0-10, 20-30'), False, True, True),
+			(SparseRange('0-10, 15, 20-30'), False, True, False),
+			(SparseRange(), True, False, True),
+			(range(10, 20), True, False, False),
+			(range(0, 30), False, True, False),
+			(range(5, 8), False, False, True),
+			(range(15, 15), True, False, True),
+			([5, 20, 25], False, False, True),
+			([5, 15], False, False, False),
+			([], True, False, True),
+		)
+		for other, disjoint, subset, superset in cases:
+			self.assertEqual(x.isdisjoint(other), disjoint, other)
+			self.assertEqual(x.issubset(other), subset, other)
+			self.assertEqual(x.issuperset(other), superset, other)
+		
+		# The null range is disjoint from, and a subset of, everything.
+		empty = SparseRange()
+		for other in (x, SparseRange(), range(0, 10), range(3, 3), [], [1]):
+			self.assertTrue(empty.isdisjoint(other))
+			self.assertTrue(empty.issubset(other))
+			self.assertEqual(empty.issuperset(other), not len(other))
+	
+	def test_split(self):
+		"""Confirm split cuts the range at each point in turn."""
+		
+		x = SparseRange('10-20, 30-40, 50-60')
+		self.assertEqual(list(x.split(35)), [
+			SparseRange('10-20, 30-35'), SparseRange('35-40, 50-60')
+		])
+		self.assertEqual(list(x.split([20, 25, 35, 70])), [
+			SparseRange(10, 20), SparseRange(), SparseRange(30, 35),
+			SparseRange('35-40, 50-60'), SparseRange()
+		])
+		self.assertEqual(list(x.split([])), [x])
+		self.assertEqual(list(x.split([0])), [SparseRange(), x])
+		
+		# Points that go backwards give null pieces.
+		self.assertEqual(list(x.split([40, 15])), [
+			SparseRange('10-20, 30-40'), SparseRange(), SparseRange(50, 60)
+		])
+		
+		# Splitting a null range gives null pieces rather than failing.
+		self.assertEqual(list(SparseRange().split(5)), [SparseRange(), SparseRange()])
+		self.assertEqual(list(SparseRange().split([1, 2])), [SparseRange()] * 3)
+	
+	def test_empty(self):
+		"""Confirm the edge cases around null ranges."""
+		
+		x = SparseRange('0-10, 20-30')
+		self.assertEqual(SparseRange(), range(3, 3))
+		self.assertEqual(SparseRange(), range(5, 2))
+		self.assertNotEqual(x, range(3, 3))
+		self.assertEqual(x & range(5, 5), SparseRange())
+		self.assertEqual(x & range(25, 5), SparseRange())
+		self.assertEqual(x & SparseRange(), SparseRange())
+		self.assertTrue(x.isdisjoint(range(5, 5)))
+		self.assertEqual(x | [], x)
+		self.assertEqual(x - [], x)
+		self.assertEqual(SparseRange() | x, x)
+		self.assertEqual(SparseRange() ^ x, x)
+		self.assertEqual(x ^ x, SparseRange())
+		self.assertEqual(x._intersect_against(5, 5), [])
+		self.assertEqual(x._intersect_against(25, 5), [])
+		self.assertEqual(SparseRange()._intersect_against(0, 10), [])
+		
+		# Adding or removing nothing leaves the range alone.
+		y = x.copy()
+		with warnings.catch_warnings():
+			warnings.simplefilter('ignore')
+			y.addrange(5, 5)
+			y.discardrange(25, 25)
+		self.assertEqual(y, x)
+	
+	def test_contains_many(self):
+		"""Confirm contains_many tests each value in order."""
+		
+		x = SparseRange('0-10, 20-30')
+		self.assertEqual(
+			x.contains_many([5, 15, 25, 31, -1, 'x']),
+			[True, False, True, False, False, False]
+		)
+		self.assertEqual(x.contains_many([]), [])
+	
+	def test_random(self):
+		"""Confirm random operations all agree with Python sets."""
+		
+		rnd = Random(0)
+		for _ in range(500):
+			a, av = self.randomRange(rnd)
+			b, bv = self.randomRange(rnd)
+			c = sorted(rnd.sample(range(120), rnd.randint(0, 10)))
+			cv = set(c)
+			
+			for other, ov in ((b, bv), (c, cv)):
+				self.assertMatches(a | other, av | ov)
+				self.assertMatches(a & other, av & ov)
+				self.assertMatches(a - other, av - ov)
+				self.assertMatches(a ^ other, av ^ ov)
+				self.assertEqual(a.isdisjoint(other), av.isdisjoint(ov))
+				self.assertEqual(a.issubset(other), av.issubset(ov))
+				self.assertEqual(a.issuperset(other), av.issuperset(ov))
+			self.assertEqual(a == b, av == bv)
+			
+			start = rnd.randrange(120)
+			stop = start + rnd.randint(-5, 30)
+			rv = set(range(start, stop))
+			self.assertMatches(a & range(start, stop), av & rv)
+			self.assertMatches(a | range(start, stop), av | rv)
+			self.assertMatches(a - range(start, stop), av - rv)
+			self.assertEqual(a.issubset(range(start, stop)), av.issubset(rv))
+			self.assertEqual(a.issuperset(range(start, stop)), av.issuperset(rv))
+			self.assertEqual(a.isdisjoint(range(start, stop)), av.isdisjoint(rv))
+			
+			pieces = list(a.split(c))
+			self.assertEqual(len(pieces), len(c) + 1)
+			bounds = [None] + c + [None]
+			for piece, lo, hi in zip(pieces, bounds, bounds[1:]):
+				self.assertTrue(piece.issubset(a))
+				if lo is not None:
+					self.assertTrue(all(v >= lo for v in piece))
+				if hi is not None:
+					self.assertTrue(all(v < hi for v in piece))
+			whole = SparseRange()
+			for piece in pieces:
+				whole |= piece
+			self.assertMatches(whole, av)
+
+if __name__ == '__main__':
+	unittest.main()
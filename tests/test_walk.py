@@ -0,0 +1,84 @@
+"""
+Unit tests for the bitfield.walk module.
+"""
+
+from bitfield import *
+from bitfield.walk import walk, compile_tree, findnode, TestStructure
+import unittest
+
+class CompileTreeTest(unittest.TestCase):
+	def setUp(self):
+		self.basis = TestStructure()
+		self.basis.hawaii.alpha = 0xDEADBEEF
+		self.basis.hawaii.bravo = -12345
+		self.basis.hawaii.charlie = 2.5
+		self.basis.hawaii.delta.update(one = 0x2A, two = -3, three = 2, b = True)
+		self.basis.idaho = 7
+		self.basis.wyoming = 0x12345678
+		for n, c in enumerate(self.basis.california):
+			c.alpha = n
+			c.bravo = -n
+			c.charlie = n / 4.0
+			c.delta.update(one = n, two = n - 4, three = n & 3, b = n & 1)
+	
+	def leafValue(self, tree, i):
+		"""Read the value of leaf node i using nothing but the tree."""
+		offset, size, kind = tree.offsets[i], tree.sizes[i], tree.types[i]
+		if offset == int(offset) and size == sizeof(kind):
+			return kind.from_buffer(self.basis, int(offset)).value
+		
+		# A bitfield field, to be cut out of the raw bytes.
+		raw = 0
+		for n, b in enumerate(bytearray(self.basis)):
+			raw |= b << (8 * n)
+		bits = int(size * 8)
+		v = (raw >> int(offset * 8)) & ((1 << bits) - 1)
+		if kind(-1).value < 0 and v >> (bits - 1):
+			v -= 1 << bits
+		return v
+	
+	def test_matches_walk(self):
+		"""compile_tree should agree with walk, node for node."""
+		
+		for skiphidden in (True, False):
+			tree = compile_tree(TestStructure, skiphidden)
+			nodes = list(walk(self.basis, skiphidden = skiphidden))
+			index = dict((id(n), i) for i, n in enumerate(nodes))
+		
+			self.assertEqual(len(tree.names), len(nodes))
+			self.assertEqual(tree.names, tuple(n.name for n in nodes))
+			self.assertEqual(tree.types, tuple(n.type for n in nodes))
+			self.assertEqual(tree.offsets, tuple(n.baseoffset for n in nodes))
+			self.assertEqual(tree.sizes, tuple(n.size for n in nodes))
+			self.assertEqual(tree.depths, tuple(n.depth for n in nodes))
+			self.assertEqual(tree.leaf_mask, tuple(not len(n) for n in nodes))
+			self.assertEqual(tree.parents, tuple(
+				-1 if n.parent is None else index[id(n.parent)] for n in nodes
+			))
+		
+			for i, node in enumerate(nodes):
+				if tree.leaf_mask[i]:
+					self.assertEqual(self.leafValue(tree, i), node.value, node.path)
+	
+	def test_cached(self):
+		"""The tree is built once per class, whether from a class or instance."""
+		
+		tree = compile_tree(TestStructure)
+		self.assertIs(compile_tree(self.basis), tree)
+		self.assertIsNot(compile_tree(TestStructure, False), tree)
+
+class FindNodeTest(unittest.TestCase):
+	def test_paths(self):
+		"""Indices can be bracketed or dotted."""
+		
+		basis = TestStructure()
+		basis.california[2].alpha = 0x1234
+		for path in ('california[2].alpha', '.california[2].alpha', 'california.2.alpha'):
+			node = findnode(basis, path)
+			self.assertEqual(node.value, 0x1234, path)
+		
+		with self.assertRaises(ValueError):
+			findnode(basis, 'california[x]')
+
+if __name__ == '__main__':
+	unittest.main()